@@ -32,8 +32,35 @@ SOFTWARE.
 from .version import VERSION as __version__
 from .pytrr import (
     GroTrrReader,
+    TrrFrame,
+    TrrHeader,
+    TrrHeaderArray,
     read_trr_header,
     read_trr_data,
     skip_trr_data,
     write_trr_frame,
 )
+from .index import TrrIndex, read_frames
+from .timeseries import extract_timeseries
+from .compare import frame_checksums, diff_trr, compare_trr
+from .pbc import (
+    Unwrapper,
+    center_positions,
+    chunk_offsets,
+    apply_image_offset,
+    wrap_positions,
+)
+from .storage import (
+    CachedStorage,
+    CallableStorage,
+    FileStorage,
+    StorageFile,
+    open_storage,
+)
+from .writer import PresizedTrrWriter
+from .memmap import TrrMemmap
+from .query import FrameTable
+from .lazy import TrrSectionArray, to_dask, to_xarray
+from .broadcast import FrameBroadcaster, FrameSubscriber
+from .positional import PositionalTrrReader
+from .reverse import read_last_frame, reverse_frames
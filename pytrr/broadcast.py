@@ -0,0 +1,638 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for sharing decoded frames between local processes.
+
+One process (the producer) reads and decodes the frames of a TRR file
+into a ring of slots in shared memory. Any number of processes on the
+same machine (the consumers) can attach to the ring by its name and
+get the frames as NumPy views of the shared memory, so that the
+frames are read and decoded once regardless of the number of
+consumers.
+
+Each frame is given a sequence number. The producer waits before
+reusing a slot until all attached consumers have released the frame
+in it (back-pressure), so a slow consumer slows down the producer
+rather than missing frames. Consumers which attach late start with
+the next frame published.
+
+Consumers claim an entry in the ring while holding a lock on a file
+named after the ring (see :py:func:`fcntl.lockf`), so that two
+consumers attaching at the same time never get the same entry.
+
+The shared memory is not registered with the resource tracker of
+:py:mod:`multiprocessing`, since that would remove it when the first
+consumer exits. It and the lock file are removed when the producer is
+closed.
+
+Useful classes defined here
+---------------------------
+
+FrameBroadcaster
+    A class for publishing frames to a ring in shared memory.
+
+FrameSubscriber
+    A class for reading frames from a ring in shared memory.
+
+Example
+-------
+
+In the producer:
+
+>>> with FrameBroadcaster(natoms=1000, name='traj') as ring:
+>>>     ring.wait_for_consumers(2)
+>>>     ring.broadcast('traj.trr')
+
+In each consumer:
+
+>>> with FrameSubscriber('traj') as ring:
+>>>     for header, data in ring:
+>>>         print(header['step'], data['x'].mean(axis=0))
+"""
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from .pytrr import GroTrrReader, DIM, GROMACS_MAGIC, SECTIONS
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # pragma: no cover
+    shared_memory = None
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+# Record locks are held per process, so threads attaching from the
+# same process are serialized with this lock:
+_ATTACH_LOCK = threading.Lock()
+
+
+# Seconds to sleep while waiting for the producer or the consumers:
+POLL_INTERVAL = 0.0005
+
+CONTROL_DTYPE = np.dtype([
+    ('magic', np.int64),
+    ('nslots', np.int64),
+    ('natoms', np.int64),
+    ('sections', np.int64),
+    ('max_consumers', np.int64),
+    ('write_seq', np.int64),
+    ('closed', np.int64),
+])
+
+CONSUMER_DTYPE = np.dtype([
+    ('pid', np.int64),
+    ('position', np.int64),
+])
+
+SLOT_DTYPE = np.dtype([
+    ('seq', np.int64),
+    ('step', np.int64),
+    ('sections', np.int64),
+    ('time', np.float64),
+    ('lambda', np.float64),
+])
+
+
+def _section_mask(sections):
+    """Return a bit mask for the given sections."""
+    return sum(1 << SECTIONS.index(i) for i in set(sections))
+
+
+def _mask_sections(mask):
+    """Return the sections in a bit mask."""
+    return tuple(i for j, i in enumerate(SECTIONS) if mask & (1 << j))
+
+
+def _open_shared_memory(name=None, create=False, size=0):
+    """Open shared memory which is not tracked by the resource tracker."""
+    if shared_memory is None:  # pragma: no cover
+        raise ImportError('Sharing frames requires Python 3.8 or newer')
+    try:
+        return shared_memory.SharedMemory(name=name, create=create,
+                                          size=size, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name, create=create,
+                                         size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _close_shared_memory(shm, unlink=False):
+    """Close (and optionally remove) shared memory."""
+    if unlink:
+        if getattr(shm, '_track', True):  # Python < 3.13
+            # unlink() unregisters, so balance the unregister in
+            # _open_shared_memory():
+            resource_tracker.register(shm._name, 'shared_memory')
+        shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        # Views of the frames are still in use. The memory is
+        # released when they are garbage collected.
+        pass
+
+
+def _lock_path(name):
+    """Return the path of the lock file for a ring."""
+    return os.path.join(tempfile.gettempdir(),
+                        'pytrr-{}.lock'.format(name.lstrip('/')))
+
+
+class _RingLock():
+    """An exclusive lock for claiming consumer entries in a ring.
+
+    The lock is a :py:func:`fcntl.lockf` lock on a file named after
+    the ring, which also serializes the threads of this process. On
+    platforms without :py:mod:`fcntl`, only the threads are serialized.
+    """
+
+    def __init__(self, name):
+        """Set up the lock for the named ring."""
+        self.path = _lock_path(name)
+        self.fileno = None
+
+    def __enter__(self):
+        """Acquire the lock."""
+        _ATTACH_LOCK.acquire()
+        try:
+            if fcntl is not None:
+                self.fileno = os.open(self.path, os.O_RDWR | os.O_CREAT,
+                                      0o600)
+                fcntl.lockf(self.fileno, fcntl.LOCK_EX)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Release the lock."""
+        try:
+            if self.fileno is not None:
+                # Closing the file releases the lock:
+                os.close(self.fileno)
+                self.fileno = None
+        finally:
+            _ATTACH_LOCK.release()
+
+
+def _is_alive(pid):
+    """Check if a process is still running."""
+    if os.name != 'posix':  # pragma: no cover
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        return True
+    return True
+
+
+def _wait(condition, timeout, message):
+    """Wait for a condition to become True."""
+    start = time.monotonic()
+    while not condition():
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(message)
+        time.sleep(POLL_INTERVAL)
+
+
+class _FrameRing():
+    """Views of the parts of a frame ring in shared memory.
+
+    Attributes
+    ----------
+    shm : object like :py:class:`multiprocessing.shared_memory.SharedMemory`
+        The shared memory holding the ring.
+    control : object like :py:class:`numpy.ndarray`
+        The layout and state of the ring.
+    consumers : object like :py:class:`numpy.ndarray`
+        The process id and position of each attached consumer.
+    slots : object like :py:class:`numpy.ndarray`
+        The header for the frame in each slot.
+    data : dict of objects like :py:class:`numpy.ndarray`
+        The data sections for each slot.
+    """
+
+    def __init__(self, shm):
+        """Create the views of the shared memory."""
+        self.shm = shm
+        self.control = np.ndarray((), dtype=CONTROL_DTYPE, buffer=shm.buf)
+        layout = self.layout(
+            int(self.control['nslots']),
+            int(self.control['natoms']),
+            _mask_sections(int(self.control['sections'])),
+            int(self.control['max_consumers']),
+        )
+        self.consumers = self._view(*layout['consumers'])
+        self.slots = self._view(*layout['slots'])
+        self.data = {}
+        for section in self.sections:
+            self.data[section] = self._view(*layout[section])
+
+    def _view(self, offset, shape, dtype):
+        """Return a view of the shared memory."""
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf,
+                          offset=offset)
+
+    @staticmethod
+    def layout(nslots, natoms, sections, max_consumers):
+        """Return the offset, shape and type of each part of the ring."""
+        parts = [
+            ('control', (), CONTROL_DTYPE),
+            ('consumers', (max_consumers,), CONSUMER_DTYPE),
+            ('slots', (nslots,), SLOT_DTYPE),
+        ]
+        for section in SECTIONS:
+            if section in sections:
+                rows = DIM if section in ('box', 'vir', 'pres') else natoms
+                parts.append((section, (nslots, rows, DIM), np.float64))
+        layout = {}
+        offset = 0
+        for key, shape, dtype in parts:
+            layout[key] = (offset, shape, dtype)
+            offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        layout['size'] = offset
+        return layout
+
+    @property
+    def name(self):
+        """The name of the shared memory."""
+        return self.shm.name
+
+    @property
+    def nslots(self):
+        """The number of slots in the ring."""
+        return int(self.control['nslots'])
+
+    @property
+    def natoms(self):
+        """The number of atoms in each frame."""
+        return int(self.control['natoms'])
+
+    @property
+    def sections(self):
+        """The sections the ring can hold."""
+        return _mask_sections(int(self.control['sections']))
+
+    def _release_views(self):
+        """Drop the views so that the shared memory can be closed."""
+        self.control = None
+        self.consumers = None
+        self.slots = None
+        self.data = {}
+
+
+class FrameBroadcaster(_FrameRing):
+    """Publish frames to a ring in shared memory.
+
+    Attributes
+    ----------
+    published : integer
+        The number of frames published.
+    """
+
+    def __init__(self, natoms, sections=('box', 'x'), nslots=8,
+                 max_consumers=16, name=None):
+        """Create the ring.
+
+        Parameters
+        ----------
+        natoms : integer
+            The number of atoms in each frame.
+        sections : tuple of strings, optional
+            The sections to share. Other sections in the published
+            frames are ignored.
+        nslots : integer, optional
+            The number of frames the ring can hold.
+        max_consumers : integer, optional
+            The maximum number of consumers which can attach.
+        name : string, optional
+            The name of the shared memory. If not given, a unique
+            name is created and can be found as ``ring.name``.
+        """
+        unknown = set(sections) - set(SECTIONS)
+        if unknown:
+            raise ValueError('Unknown sections: {}'.format(sorted(unknown)))
+        if nslots < 1 or max_consumers < 1:
+            raise ValueError('Expected at least one slot and one consumer')
+        layout = self.layout(nslots, natoms, sections, max_consumers)
+        shm = _open_shared_memory(name=name, create=True,
+                                  size=layout['size'])
+        control = np.ndarray((), dtype=CONTROL_DTYPE, buffer=shm.buf)
+        control['nslots'] = nslots
+        control['natoms'] = natoms
+        control['sections'] = _section_mask(sections)
+        control['max_consumers'] = max_consumers
+        control['write_seq'] = 0
+        control['closed'] = 0
+        del control
+        super().__init__(shm)
+        self.consumers[:] = 0
+        self.slots['seq'] = -1
+        if fcntl is not None:
+            os.close(os.open(_lock_path(self.name),
+                             os.O_RDWR | os.O_CREAT, 0o600))
+        # Mark the ring as ready, after the layout is written:
+        self.control['magic'] = GROMACS_MAGIC
+        self.published = 0
+
+    def __enter__(self):
+        """Return the ring for use in a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """End the stream and remove the ring."""
+        self.close()
+
+    def active_consumers(self):
+        """Return the number of attached consumers.
+
+        Consumers whose processes have died are detached.
+
+        Returns
+        -------
+        out : integer
+            The number of attached consumers.
+        """
+        active = 0
+        for consumer in self.consumers:
+            pid = int(consumer['pid'])
+            if pid == 0:
+                continue
+            if _is_alive(pid):
+                active += 1
+            else:
+                consumer['pid'] = 0
+        return active
+
+    def wait_for_consumers(self, count, timeout=None):
+        """Wait until a number of consumers have attached.
+
+        Parameters
+        ----------
+        count : integer
+            The number of consumers to wait for.
+        timeout : float, optional
+            The maximum number of seconds to wait.
+        """
+        _wait(lambda: self.active_consumers() >= count, timeout,
+              'Timed out waiting for {} consumers'.format(count))
+
+    def _slot_free(self, seq):
+        """Check if all consumers are done with the frame before seq."""
+        oldest = seq - self.nslots
+        if oldest < 0:
+            return True
+        for consumer in self.consumers:
+            pid = int(consumer['pid'])
+            if pid == 0 or consumer['position'] > oldest:
+                continue
+            if _is_alive(pid):
+                return False
+            consumer['pid'] = 0
+        return True
+
+    def publish(self, header, data, timeout=None):
+        """Publish a frame to the consumers.
+
+        Parameters
+        ----------
+        header : dict
+            The header for the frame, e.g. as read by
+            :py:func:`.read_trr_header`.
+        data : dict
+            The data for the frame, e.g. as read by
+            :py:func:`.read_trr_data`.
+        timeout : float, optional
+            The maximum number of seconds to wait for the consumers
+            to release the slot we will write to.
+
+        Returns
+        -------
+        out : integer
+            The sequence number of the frame.
+        """
+        if self.control['closed']:
+            raise ValueError('The stream has ended')
+        if header['natoms'] != self.natoms:
+            raise ValueError(
+                'Expected {} atoms, got {}'.format(self.natoms,
+                                                   header['natoms'])
+            )
+        seq = int(self.control['write_seq'])
+        _wait(lambda: self._slot_free(seq), timeout,
+              'Timed out waiting for the consumers')
+        slot = seq % self.nslots
+        present = []
+        for section in self.sections:
+            if data.get(section) is not None:
+                self.data[section][slot] = data[section]
+                present.append(section)
+        self.slots[slot] = (seq, header['step'], _section_mask(present),
+                            header['time'], header['lambda'])
+        # Make the frame visible, after it has been written:
+        self.control['write_seq'] = seq + 1
+        self.published += 1
+        return seq
+
+    def broadcast(self, filename, timeout=None, access='sequential'):
+        """Read and publish all frames in a file.
+
+        Parameters
+        ----------
+        filename : string, file object, callable or storage
+            The TRR file to read.
+        timeout : float, optional
+            The maximum number of seconds to wait for the consumers,
+            for each frame.
+        access : string, optional
+            The access pattern hint for reading the file.
+
+        Returns
+        -------
+        out : integer
+            The number of frames published.
+        """
+        count = 0
+        with GroTrrReader(filename, access=access) as trr:
+            while True:
+                try:
+                    header, data = trr.read_frame()
+                except EOFError:
+                    break
+                self.publish(header, data, timeout=timeout)
+                count += 1
+        return count
+
+    def end(self):
+        """Mark the end of the stream for the consumers."""
+        if self.control is not None:
+            self.control['closed'] = 1
+
+    def close(self):
+        """End the stream and remove the ring.
+
+        Consumers which are attached keep their mapping of the ring
+        and can read the remaining frames.
+        """
+        if self.shm is None:
+            return
+        self.end()
+        self._release_views()
+        try:
+            os.remove(_lock_path(self.shm.name))
+        except FileNotFoundError:
+            pass
+        _close_shared_memory(self.shm, unlink=True)
+        self.shm = None
+
+
+class FrameSubscriber(_FrameRing):
+    """Read frames from a ring in shared memory.
+
+    The frames are returned as read-only views of the shared memory.
+    A frame stays valid until it is released, which happens when the
+    next frame is requested, or with :py:meth:`.release`. Data which
+    is needed for longer should be copied.
+
+    Attributes
+    ----------
+    position : integer
+        The sequence number of the next frame to read.
+    """
+
+    def __init__(self, name, timeout=None):
+        """Attach to a ring.
+
+        Parameters
+        ----------
+        name : string
+            The name of the ring, see :py:attr:`.FrameBroadcaster.name`.
+        timeout : float, optional
+            The maximum number of seconds to wait for a free consumer
+            entry in the ring.
+        """
+        shm = _open_shared_memory(name=name)
+        control = np.ndarray((), dtype=CONTROL_DTYPE, buffer=shm.buf)
+        ready = control['magic'] == GROMACS_MAGIC
+        del control
+        if not ready:
+            _close_shared_memory(shm)
+            raise ValueError('"{}" is not a frame ring'.format(name))
+        super().__init__(shm)
+        self._entry = None
+        self._current = None
+        try:
+            _wait(self._attach, timeout, 'No free consumer entries')
+        except TimeoutError:
+            self.close()
+            raise
+
+    def _attach(self):
+        """Try to claim a free consumer entry.
+
+        The entries are only claimed while holding the lock for the
+        ring, so no other consumer can claim the same entry.
+        """
+        with _RingLock(self.name):
+            for i, consumer in enumerate(self.consumers):
+                if consumer['pid'] != 0:
+                    continue
+                consumer['position'] = self.control['write_seq']
+                consumer['pid'] = os.getpid()
+                # Frames published before the producer saw us may
+                # have reused slots, so start after them:
+                consumer['position'] = self.control['write_seq']
+                self._entry = i
+                return True
+        return False
+
+    def __enter__(self):
+        """Return the ring for use in a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Detach from the ring."""
+        self.close()
+
+    @property
+    def position(self):
+        """The sequence number of the next frame to read."""
+        return int(self.consumers[self._entry]['position'])
+
+    def release(self):
+        """Release the current frame so that its slot can be reused."""
+        if self._current is not None:
+            self.consumers[self._entry]['position'] = self._current + 1
+            self._current = None
+
+    def next_frame(self, timeout=None):
+        """Return the next frame, releasing the current one.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait for a frame.
+
+        Returns
+        -------
+        out[0] : dict
+            The header for the frame, with the number of atoms, the
+            step, the time and lambda.
+        out[1] : dict
+            Read-only views of the data sections in the frame.
+        """
+        self.release()
+        seq = self.position
+
+        def _ready():
+            """Check if the frame is ready, or the stream has ended."""
+            return (self.control['write_seq'] > seq or
+                    bool(self.control['closed']))
+
+        _wait(_ready, timeout, 'Timed out waiting for frame {}'.format(seq))
+        if self.control['write_seq'] <= seq:
+            raise EOFError('The stream has ended')
+        slot = seq % self.nslots
+        meta = self.slots[slot]
+        if meta['seq'] != seq:
+            raise ValueError('Frame {} was overwritten'.format(seq))
+        header = {
+            'natoms': self.natoms,
+            'step': int(meta['step']),
+            'time': float(meta['time']),
+            'lambda': float(meta['lambda']),
+        }
+        data = {}
+        for section in _mask_sections(int(meta['sections'])):
+            view = self.data[section][slot]
+            view.flags.writeable = False
+            data[section] = view
+        self._current = seq
+        return header, data
+
+    def __iter__(self):
+        """Iterate over the frames until the stream ends."""
+        while True:
+            try:
+                yield self.next_frame()
+            except EOFError:
+                return
+
+    def close(self):
+        """Detach from the ring."""
+        if self.shm is None:
+            return
+        if self._entry is not None:
+            self.consumers[self._entry]['pid'] = 0
+            self._entry = None
+        self._current = None
+        self._release_views()
+        _close_shared_memory(self.shm)
+        self.shm = None
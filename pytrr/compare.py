@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for checksumming and comparing TRR files.
+
+The methods defined here hash the raw bytes of each section in each
+frame of a TRR file. Files can then be compared by their hashes, and
+only the sections that differ need to be decoded for a numerical
+comparison.
+
+Useful methods defined here
+---------------------------
+
+frame_checksums
+    Calculate checksums for the sections in each frame of a TRR file.
+
+diff_trr
+    Find the sections that differ (byte-wise) between two TRR files.
+
+compare_trr
+    Find the sections that differ numerically between two TRR files.
+
+Example
+-------
+
+>>> differences = diff_trr('traj.trr', 'copy.trr')
+>>> if differences:
+>>>     print('First difference (frame, section):', differences[0])
+
+The comparison can also be run from the command line:
+
+.. code:: bash
+
+   python -m pytrr.compare traj.trr copy.trr --rtol 1e-5
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import os
+import sys
+import numpy as np
+from .index import TrrIndex
+from .iohints import advise_memmap, release_memmap
+from .pytrr import DATA_ITEMS, HEAD_ITEMS, SECTIONS
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+
+HASH_BLOCK = 256
+
+
+def _new_hash(algorithm):
+    """Create a new hash object.
+
+    Parameters
+    ----------
+    algorithm : string
+        The hash algorithm to use. This can be any algorithm supported
+        by :py:mod:`hashlib` or, if :py:mod:`xxhash` is installed,
+        one of ``'xxh32'``, ``'xxh64'`` or ``'xxh128'``.
+
+    Returns
+    -------
+    out : object
+        A hash object with an ``update`` and ``digest`` method.
+    """
+    if algorithm.startswith('xxh'):
+        if xxhash is None:
+            raise ValueError(
+                'Algorithm "{}" requires the xxhash package'.format(algorithm)
+            )
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def frame_ranges(index, frame):
+    """Return the byte ranges for the sections in a frame.
+
+    Parameters
+    ----------
+    index : object like :py:class:`.TrrIndex`
+        The index for the file.
+    frame : integer
+        The frame to get ranges for.
+
+    Returns
+    -------
+    out : list of tuples
+        The ranges as ``(section, start, stop)``. The header of the
+        frame is included as the section ``'header'``.
+    """
+    start = int(index.offsets[frame])
+    stop = int(index.data_offsets[frame])
+    ranges = [('header', start, stop)]
+    header = index.headers[frame]
+    for key, section in zip(DATA_ITEMS, SECTIONS):
+        if header[key] != 0:
+            start, stop = stop, stop + header[key]
+            ranges.append((section, start, stop))
+    return ranges
+
+
+def _hash_frames(raw, index, algorithm, frames, release=None):
+    """Hash the sections for some frames.
+
+    Parameters
+    ----------
+    raw : object like :py:class:`numpy.memmap`
+        The raw bytes of the file.
+    index : object like :py:class:`.TrrIndex`
+        The index for the file.
+    algorithm : string
+        The hash algorithm to use.
+    frames : range
+        The (consecutive) frames to hash.
+    release : string, optional
+        If given, the file name to drop the hashed frames from the
+        page cache for.
+
+    Returns
+    -------
+    out : list of dicts
+        The digest for each section in each frame.
+    """
+    checksums = []
+    for frame in frames:
+        digest = {}
+        for section, start, stop in frame_ranges(index, frame):
+            hasher = _new_hash(algorithm)
+            hasher.update(raw[start:stop])
+            digest[section] = hasher.digest()
+        checksums.append(digest)
+    if release is not None and len(frames) > 0:
+        first = int(index.offsets[frames[0]])
+        release_memmap(raw, release, first,
+                       index.frame_end(frames[-1]) - first)
+    return checksums
+
+
+def frame_checksums(filename, index=None, algorithm='blake2b', workers=None,
+                    store=False, access='sequential'):
+    """Calculate checksums for the sections in each frame of a TRR file.
+
+    The file is memory mapped and the hashing is done in parallel
+    threads. The hashing in :py:mod:`hashlib` releases the GIL, so the
+    threads will run concurrently.
+
+    Parameters
+    ----------
+    filename : string
+        The TRR file to hash.
+    index : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the file.
+    algorithm : string, optional
+        The hash algorithm to use.
+    workers : integer, optional
+        The number of threads to use.
+    store : boolean, optional
+        If True, the checksums are stored in the index as
+        ``index.checksums``, and they will be reused when comparing.
+    access : string, optional
+        A hint about the access pattern for the memory mapped file,
+        see :py:mod:`pytrr.iohints`. With ``'once'``, each block of
+        frames is dropped from the page cache after it is hashed.
+
+    Returns
+    -------
+    checksums : list of dicts
+        For each frame, the digest for each section. The sections
+        are ``'header'`` and the data sections present in the frame.
+    """
+    if index is None:
+        index = TrrIndex.from_file(filename)
+    checksums = []
+    if len(index) > 0:
+        raw = np.memmap(filename, dtype=np.uint8, mode='r')
+        if access is not None:
+            advise_memmap(raw, access)
+        blocks = [range(i, min(i + HASH_BLOCK, len(index)))
+                  for i in range(0, len(index), HASH_BLOCK)]
+        task = functools.partial(
+            _hash_frames, raw, index, algorithm,
+            release=filename if access == 'once' else None,
+        )
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(task, blocks):
+                checksums.extend(result)
+    if store:
+        index.checksums = checksums
+        index.checksum_algorithm = algorithm
+    return checksums
+
+
+def _get_checksums(filename, index, algorithm, workers):
+    """Return checksums, reusing the ones stored in an index."""
+    if index is None:
+        index = TrrIndex.from_file(filename)
+    if index.checksums is None or index.checksum_algorithm != algorithm:
+        frame_checksums(filename, index=index, algorithm=algorithm,
+                        workers=workers, store=True)
+    return index, index.checksums
+
+
+def diff_trr(file1, file2, index1=None, index2=None, algorithm='blake2b',
+             workers=None):
+    """Find the sections that differ byte-wise between two TRR files.
+
+    Parameters
+    ----------
+    file1 : string
+        The first TRR file.
+    file2 : string
+        The second TRR file.
+    index1 : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the first file.
+    index2 : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the second file.
+    algorithm : string, optional
+        The hash algorithm to use.
+    workers : integer, optional
+        The number of threads to use for hashing.
+
+    Returns
+    -------
+    differences : list of tuples
+        The differing sections, as ``(frame, section)``, ordered by
+        the frame number. Frames present in only one of the files are
+        reported with the section ``'frame'``.
+    """
+    _, sums1 = _get_checksums(file1, index1, algorithm, workers)
+    _, sums2 = _get_checksums(file2, index2, algorithm, workers)
+    differences = []
+    for frame, (digest1, digest2) in enumerate(zip(sums1, sums2)):
+        for section in ('header',) + SECTIONS:
+            if digest1.get(section) != digest2.get(section):
+                differences.append((frame, section))
+    for frame in range(min(len(sums1), len(sums2)),
+                       max(len(sums1), len(sums2))):
+        differences.append((frame, 'frame'))
+    return differences
+
+
+def _read_section(raw, index, frame, section):
+    """Decode a section from a memory mapped file."""
+    header = index.headers[frame]
+    if section == 'header':
+        return header
+    if header['{}_size'.format(section)] == 0:
+        return None
+    return index.section_view(raw, frame, section)
+
+
+def _sections_close(data1, data2, section, rtol, atol):
+    """Check if two decoded sections are numerically close."""
+    if data1 is None or data2 is None:
+        return data1 is None and data2 is None
+    if section == 'header':
+        for key in HEAD_ITEMS:
+            val1, val2 = data1[key], data2[key]
+            if key in ('time', 'lambda'):
+                close = np.isclose(val1, val2, rtol=rtol, atol=atol)
+            elif key.endswith('_size'):
+                # The sizes depend on the precision, so we only
+                # check that the same sections are present.
+                close = (val1 == 0) == (val2 == 0)
+            else:
+                close = val1 == val2
+            if not close:
+                return False
+        return True
+    if data1.shape != data2.shape:
+        return False
+    return np.allclose(data1, data2, rtol=rtol, atol=atol)
+
+
+def compare_trr(file1, file2, rtol=1e-05, atol=1e-08, index1=None,
+                index2=None, algorithm='blake2b', workers=None):
+    """Find the sections that differ numerically between two TRR files.
+
+    The files are first compared by hashing, and only the sections
+    that differ byte-wise are decoded and compared with a tolerance.
+
+    Parameters
+    ----------
+    file1 : string
+        The first TRR file.
+    file2 : string
+        The second TRR file.
+    rtol : float, optional
+        The relative tolerance, see :py:func:`numpy.allclose`.
+    atol : float, optional
+        The absolute tolerance, see :py:func:`numpy.allclose`.
+    index1 : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the first file.
+    index2 : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the second file.
+    algorithm : string, optional
+        The hash algorithm to use.
+    workers : integer, optional
+        The number of threads to use for hashing.
+
+    Returns
+    -------
+    differences : list of tuples
+        The sections that are not close, as ``(frame, section)``.
+        Frames present in only one of the files, or which are cut
+        short by the end of a file, are reported with the section
+        ``'frame'``.
+    """
+    index1, _ = _get_checksums(file1, index1, algorithm, workers)
+    index2, _ = _get_checksums(file2, index2, algorithm, workers)
+    differences = diff_trr(file1, file2, index1=index1, index2=index2,
+                           algorithm=algorithm, workers=workers)
+    size1 = os.path.getsize(file1)
+    size2 = os.path.getsize(file2)
+    raw1, raw2 = None, None
+    not_close = []
+    for frame, section in differences:
+        if section != 'frame' and (index1.frame_end(frame) > size1 or
+                                   index2.frame_end(frame) > size2):
+            # The frame is truncated, and can not be decoded:
+            section = 'frame'
+        if section == 'frame':
+            if (frame, section) not in not_close[-1:]:
+                not_close.append((frame, section))
+            continue
+        if raw1 is None:
+            # Only map the files when there is data to decode, since
+            # empty files can not be mapped:
+            raw1 = np.memmap(file1, dtype=np.uint8, mode='r')
+            raw2 = np.memmap(file2, dtype=np.uint8, mode='r')
+        data1 = _read_section(raw1, index1, frame, section)
+        data2 = _read_section(raw2, index2, frame, section)
+        if not _sections_close(data1, data2, section, rtol, atol):
+            not_close.append((frame, section))
+    return not_close
+
+
+def main(args=None):
+    """Compare two TRR files from the command line.
+
+    Parameters
+    ----------
+    args : list of strings, optional
+        The command line arguments. If not given, ``sys.argv`` is used.
+
+    Returns
+    -------
+    out : integer
+        0 if the files are equal, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(
+        description='Compare two GROMACS TRR files frame by frame.'
+    )
+    parser.add_argument('file1', help='The first TRR file.')
+    parser.add_argument('file2', help='The second TRR file.')
+    parser.add_argument('--rtol', type=float, default=None,
+                        help='Relative tolerance for a numerical compare.')
+    parser.add_argument('--atol', type=float, default=None,
+                        help='Absolute tolerance for a numerical compare.')
+    parser.add_argument('--algorithm', default='blake2b',
+                        help='The hash algorithm to use.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='The number of threads to use.')
+    args = parser.parse_args(args)
+    if args.rtol is None and args.atol is None:
+        differences = diff_trr(args.file1, args.file2,
+                               algorithm=args.algorithm,
+                               workers=args.workers)
+    else:
+        differences = compare_trr(
+            args.file1, args.file2,
+            rtol=0.0 if args.rtol is None else args.rtol,
+            atol=0.0 if args.atol is None else args.atol,
+            algorithm=args.algorithm, workers=args.workers,
+        )
+    if not differences:
+        print('The files are equal.')
+        return 0
+    frame, section = differences[0]
+    print('First difference in frame {}, section "{}".'.format(frame,
+                                                               section))
+    print('Number of differing sections: {}'.format(len(differences)))
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
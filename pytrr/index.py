@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for indexing the frames in GROMACS TRR files.
+
+The index stores the byte offset of each frame in a TRR file
+together with the header read for the frame. This makes it
+possible to access the data sections of a frame directly, without
+reading through all the preceding frames.
+
+Useful methods defined here
+---------------------------
+
+read_frames
+    Read data for selected frames using coalesced range reads.
+
+Useful classes defined here
+---------------------------
+
+TrrIndex
+    A class holding the frame offsets and headers of a TRR file.
+
+Example
+-------
+
+>>> index = TrrIndex.from_file('traj.trr')
+>>> print(len(index), index.section_offset(10, 'x'))
+"""
+import numpy as np
+from .pytrr import (
+    get_codec,
+    header_sections,
+    read_matrix,
+    read_trr_header,
+    skip_trr_data,
+    TrrHeaderArray,
+    DATA_ITEMS,
+    DIM,
+    SECTIONS,
+)
+from .storage import is_path, open_file, open_storage
+
+
+# The number of headers to prefetch when indexing from a storage:
+HEADER_PREFETCH = 64
+
+
+def section_dtype(header):
+    """Return the numpy data type for the data sections of a frame.
+
+    Parameters
+    ----------
+    header : dict
+        The header read from the TRR file.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.dtype`
+        The data type, with the byte order and precision used
+        in the file.
+    """
+    return get_codec(header['endian'], header['double']).dtype
+
+
+def section_shape(header, section):
+    """Return the shape of a data section in a frame.
+
+    Parameters
+    ----------
+    header : dict
+        The header read from the TRR file.
+    section : string
+        The section we are requesting, e.g. ``'box'`` or ``'x'``.
+
+    Returns
+    -------
+    out : tuple of ints
+        The shape of the section.
+    """
+    if section in ('box', 'vir', 'pres'):
+        return (DIM, DIM)
+    return (header['natoms'], DIM)
+
+
+class TrrIndex():
+    """A class for storing the locations of frames in a TRR file.
+
+    Attributes
+    ----------
+    filename : string
+        The file the index was created for.
+    offsets : object like :py:class:`numpy.ndarray`
+        The byte offsets for the start of each frame.
+    data_offsets : object like :py:class:`numpy.ndarray`
+        The byte offsets for the start of the data sections (i.e.
+        just after the header) for each frame.
+    headers : object like :py:class:`.TrrHeaderArray`
+        The headers read for each frame.
+    checksums : list of dicts
+        Checksums for the sections in each frame, if they have
+        been calculated, see :py:func:`.frame_checksums`.
+    checksum_algorithm : string
+        The hash algorithm used for ``checksums``.
+    boxes : object like :py:class:`numpy.ndarray`
+        The box matrices for each frame, with shape ``(nframes, 3, 3)``,
+        if they were read when indexing. Frames without a box have
+        NaN entries.
+    """
+
+    def __init__(self, offsets, data_offsets, headers, filename=None,
+                 boxes=None):
+        """Set up the index.
+
+        Parameters
+        ----------
+        offsets : iterable of ints
+            The byte offsets for the start of each frame.
+        data_offsets : iterable of ints
+            The byte offsets for the data sections of each frame.
+        headers : iterable of headers
+            The headers for each frame.
+        filename : string, optional
+            The file the index was created for.
+        boxes : object like :py:class:`numpy.ndarray`, optional
+            The box matrices for each frame.
+        """
+        self.filename = filename
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.data_offsets = np.asarray(data_offsets, dtype=np.int64)
+        if not isinstance(headers, TrrHeaderArray):
+            headers = TrrHeaderArray(headers)
+        self.headers = headers
+        self.boxes = boxes
+        self.checksums = None
+        self.checksum_algorithm = None
+
+    @classmethod
+    def from_file(cls, filename, read_boxes=False):
+        """Create an index by scanning the headers in a TRR file.
+
+        When reading from a storage (see :py:mod:`pytrr.storage`), the
+        headers (and boxes, if they are read) of the following frames
+        are prefetched, assuming that the frames have the same size, so
+        that the scan needs few requests, see
+        :py:meth:`.CachedStorage.prefetch`.
+
+        Parameters
+        ----------
+        filename : string, file object, callable or storage
+            The TRR file to index.
+        read_boxes : boolean, optional
+            If True, the box matrices (which follow directly after
+            the headers) are read and stored in the index. This makes
+            the scan slower, so it is only done when asked for (e.g.
+            by :py:meth:`.FrameTable.from_file`).
+
+        Returns
+        -------
+        out : object like :py:class:`.TrrIndex`
+            The index created for the file.
+        """
+        offsets, data_offsets, headers, boxes = [], [], [], []
+        with open_file(filename) as fileh:
+            prefetch = getattr(fileh, 'prefetch', None)
+            while True:
+                offset = fileh.tell()
+                try:
+                    header = read_trr_header(fileh)
+                except EOFError:
+                    break
+                offsets.append(offset)
+                data_offsets.append(fileh.tell())
+                headers.append(header)
+                if prefetch and len(offsets) % HEADER_PREFETCH == 1:
+                    header_size = data_offsets[-1] - offset
+                    frame_size = header_size + sum(
+                        header[key] for key in DATA_ITEMS
+                    )
+                    if read_boxes:
+                        header_size += header['box_size']
+                    prefetch([(offset + i * frame_size, header_size)
+                              for i in range(1, HEADER_PREFETCH + 1)])
+                if read_boxes and header['box_size'] != 0:
+                    boxes.append(read_matrix(fileh, header['endian'],
+                                             header['double']))
+                    fileh.seek(data_offsets[-1], 0)
+                elif read_boxes:
+                    boxes.append(np.full((DIM, DIM), np.nan))
+                skip_trr_data(fileh, header)
+        if read_boxes:
+            boxes = np.array(boxes).reshape((len(offsets), DIM, DIM))
+        else:
+            boxes = None
+        return cls(offsets, data_offsets, headers,
+                   filename=filename if is_path(filename) else None,
+                   boxes=boxes)
+
+    def __len__(self):
+        """Return the number of frames in the index."""
+        return len(self.offsets)
+
+    def section_offset(self, frame, section):
+        """Return the byte offset for a data section in a frame.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+        section : string
+            The section to locate, that is one of ``'box'``, ``'vir'``,
+            ``'pres'``, ``'x'``, ``'v'`` or ``'f'``.
+
+        Returns
+        -------
+        out : integer
+            The byte offset of the section in the file.
+
+        Raises
+        ------
+        KeyError
+            If the section is not present in the frame.
+        """
+        header = self.headers[frame]
+        offset = int(self.data_offsets[frame])
+        for key, name in zip(DATA_ITEMS, SECTIONS):
+            if name == section:
+                if header[key] == 0:
+                    raise KeyError(
+                        'Section "{}" not in frame {}'.format(section, frame)
+                    )
+                return offset
+            offset += header[key]
+        raise KeyError('Unknown section "{}"'.format(section))
+
+    def frame_end(self, frame):
+        """Return the byte offset just after a frame.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+
+        Returns
+        -------
+        out : integer
+            The offset of the first byte after the frame.
+        """
+        header = self.headers[frame]
+        return int(self.data_offsets[frame]) + sum(header[key]
+                                                   for key in DATA_ITEMS)
+
+    def section_view(self, raw, frame, section):
+        """Return a view of a data section in a buffer with the file.
+
+        Parameters
+        ----------
+        raw : buffer, e.g. object like :py:class:`numpy.memmap`
+            The contents of the file, typically memory mapped.
+        frame : integer
+            The index of the frame.
+        section : string
+            The section to return, e.g. ``'box'`` or ``'x'``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            A view of the section, with the byte order and precision
+            used in the file.
+
+        Raises
+        ------
+        KeyError
+            If the section is not present in the frame.
+        """
+        header = self.headers[frame]
+        return np.ndarray(section_shape(header, section),
+                          dtype=section_dtype(header), buffer=raw,
+                          offset=self.section_offset(frame, section))
+
+
+def read_frames(source, index, frames=None, sections=None):
+    """Read data for selected frames, with coalesced range reads.
+
+    All the requested byte ranges are collected first and then read
+    with :py:meth:`.RangeStorage.read_ranges`, so that adjacent ranges
+    are fetched in a few large requests.
+
+    Parameters
+    ----------
+    source : string, file object, callable or storage
+        The TRR file to read from, see :py:func:`.open_storage`.
+    index : object like :py:class:`.TrrIndex`
+        The index for the file.
+    frames : iterable of ints, optional
+        The frames to read. If not given, all frames are read.
+    sections : iterable of strings, optional
+        The sections to read. If not given, all sections present
+        in the frames are read.
+
+    Returns
+    -------
+    out : list of dicts
+        The data for each frame, as returned by
+        :py:func:`.read_trr_data`.
+    """
+    if frames is None:
+        frames = range(len(index))
+    frames = list(frames)
+    storage = open_storage(source)
+    ranges, keys = [], []
+    for i, frame in enumerate(frames):
+        header = index.headers[frame]
+        present = header_sections(header)
+        for section in (present if sections is None else sections):
+            if section not in present:
+                continue
+            codec = get_codec(header['endian'], header['double'],
+                              header['natoms'])
+            ranges.append((index.section_offset(frame, section),
+                           header['{}_size'.format(section)]))
+            keys.append((i, section, codec, section_shape(header, section)))
+    data = [{} for _ in frames]
+    try:
+        buffers = storage.read_ranges(ranges)
+    finally:
+        if storage is not source:
+            storage.close()
+    for (i, section, codec, shape), buff in zip(keys, buffers):
+        data[i][section] = codec.decode(buff, shape)
+    return data
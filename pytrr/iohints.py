@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for giving the operating system hints about file access.
+
+The access pattern for a file can be one of:
+
+- ``'normal'``: no special treatment.
+- ``'sequential'``: the file is read from start to end, and the
+  kernel can read ahead aggressively.
+- ``'random'``: the file is read at random positions, and read ahead
+  is not useful.
+- ``'once'``: the file is read sequentially and only once. Data which
+  has been consumed is dropped from the page cache, so that we do
+  not evict data used by other processes.
+
+The hints are given with :py:func:`os.posix_fadvise` for files and
+:py:meth:`mmap.mmap.madvise` for memory maps. On platforms where these
+are not available, the hints are silently ignored.
+
+Useful methods defined here
+---------------------------
+
+advise_file
+    Give a hint about the access pattern for an open file.
+
+advise_memmap
+    Give a hint about the access pattern for a memory map.
+
+drop_cache
+    Drop (part of) a file from the page cache.
+
+release_memmap
+    Drop a consumed region of a memory mapped file from the page cache.
+
+will_need
+    Ask the operating system to start reading a region of a file.
+"""
+import mmap
+import os
+
+
+ACCESS_PATTERNS = ('normal', 'sequential', 'random', 'once')
+# The number of consumed bytes to collect before dropping them from the
+# page cache for the "once" access pattern:
+RELEASE_BYTES = 16 * 1024**2
+
+_FADVISE = {
+    'normal': 'POSIX_FADV_NORMAL',
+    'sequential': 'POSIX_FADV_SEQUENTIAL',
+    'random': 'POSIX_FADV_RANDOM',
+    'once': 'POSIX_FADV_SEQUENTIAL',
+}
+
+_MADVISE = {
+    'normal': 'MADV_NORMAL',
+    'sequential': 'MADV_SEQUENTIAL',
+    'random': 'MADV_RANDOM',
+    'once': 'MADV_SEQUENTIAL',
+}
+
+
+def check_access(access):
+    """Check that we know the given access pattern."""
+    if access not in ACCESS_PATTERNS:
+        raise ValueError(
+            'Unknown access pattern "{}", expected one of: {}'.format(
+                access, ', '.join(ACCESS_PATTERNS)
+            )
+        )
+
+
+def _fadvise(fileno, offset, length, advice):
+    """Call posix_fadvise if it is available.
+
+    Returns
+    -------
+    out : boolean
+        True if the advice was given.
+    """
+    flag = getattr(os, advice, None)
+    if flag is None or not hasattr(os, 'posix_fadvise'):
+        return False
+    try:
+        os.posix_fadvise(fileno, offset, length, flag)
+    except OSError:
+        return False
+    return True
+
+
+def advise_file(fileh, access, offset=0, length=0):
+    """Give a hint about the access pattern for an open file.
+
+    Parameters
+    ----------
+    fileh : file object or integer
+        The open file (or file descriptor).
+    access : string
+        The access pattern, see ``ACCESS_PATTERNS``.
+    offset : integer, optional
+        The start of the region the hint applies to.
+    length : integer, optional
+        The length of the region. 0 means to the end of the file.
+
+    Returns
+    -------
+    out : boolean
+        True if the hint was given to the operating system.
+    """
+    check_access(access)
+    fileno = fileh if isinstance(fileh, int) else fileh.fileno()
+    return _fadvise(fileno, offset, length, _FADVISE[access])
+
+
+def will_need(fileh, offset, length):
+    """Tell the operating system that we will soon read a region.
+
+    Parameters
+    ----------
+    fileh : file object or integer
+        The open file (or file descriptor).
+    offset : integer
+        The start of the region.
+    length : integer
+        The length of the region.
+
+    Returns
+    -------
+    out : boolean
+        True if the hint was given to the operating system.
+    """
+    fileno = fileh if isinstance(fileh, int) else fileh.fileno()
+    return _fadvise(fileno, offset, length, 'POSIX_FADV_WILLNEED')
+
+
+def release(fileh, offset, length):
+    """Tell the operating system that we are done with a region.
+
+    Parameters
+    ----------
+    fileh : file object or integer
+        The open file (or file descriptor).
+    offset : integer
+        The start of the region.
+    length : integer
+        The length of the region. 0 means to the end of the file.
+
+    Returns
+    -------
+    out : boolean
+        True if the hint was given to the operating system.
+    """
+    fileno = fileh if isinstance(fileh, int) else fileh.fileno()
+    return _fadvise(fileno, offset, length, 'POSIX_FADV_DONTNEED')
+
+
+def drop_cache(filename, offset=0, length=0):
+    """Drop a region of a file from the page cache.
+
+    Parameters
+    ----------
+    filename : string
+        The file to drop from the cache.
+    offset : integer, optional
+        The start of the region.
+    length : integer, optional
+        The length of the region. 0 means to the end of the file.
+
+    Returns
+    -------
+    out : boolean
+        True if the hint was given to the operating system.
+    """
+    fileno = os.open(filename, os.O_RDONLY)
+    try:
+        return release(fileno, offset, length)
+    finally:
+        os.close(fileno)
+
+
+def advise_memmap(array, access):
+    """Give a hint about the access pattern for a memory map.
+
+    Parameters
+    ----------
+    array : object like :py:class:`numpy.memmap`
+        The memory mapped array.
+    access : string
+        The access pattern, see ``ACCESS_PATTERNS``.
+
+    Returns
+    -------
+    out : boolean
+        True if the hint was given to the operating system.
+    """
+    check_access(access)
+    mapped = getattr(array, '_mmap', None)
+    flag = getattr(mmap, _MADVISE[access], None)
+    if mapped is None or flag is None or not hasattr(mapped, 'madvise'):
+        return False
+    try:
+        mapped.madvise(flag)
+    except OSError:
+        return False
+    return True
+
+
+def release_memmap(array, filename, offset, length):
+    """Drop a consumed region of a memory mapped file from the page cache.
+
+    Pages which are mapped are not dropped by
+    :py:func:`os.posix_fadvise`, so the region is first removed from
+    the map (with ``MADV_DONTNEED``) and then dropped from the page
+    cache. Only whole pages inside the region are released, so that
+    neighbouring regions in use are not affected. The map stays valid,
+    and pages which are accessed again are read from the file.
+
+    Parameters
+    ----------
+    array : object like :py:class:`numpy.memmap`
+        The memory mapped array. It should map the whole file.
+    filename : string
+        The file which is mapped.
+    offset : integer
+        The start of the region, in bytes from the start of the file.
+    length : integer
+        The length of the region.
+
+    Returns
+    -------
+    out : boolean
+        True if the region was dropped from the page cache.
+    """
+    pagesize = mmap.PAGESIZE
+    start = -(-offset // pagesize) * pagesize
+    stop = (offset + length) // pagesize * pagesize
+    if stop <= start:
+        return False
+    mapped = getattr(array, '_mmap', None)
+    flag = getattr(mmap, 'MADV_DONTNEED', None)
+    if (mapped is not None and flag is not None and
+            hasattr(mapped, 'madvise')):
+        try:
+            mapped.madvise(flag, start, stop - start)
+        except (OSError, ValueError):
+            pass
+    return drop_cache(filename, start, stop - start)
+
+
+class CacheReleaser():
+    """Drop consumed parts of a file from the page cache.
+
+    This is used for the ``'once'`` access pattern: the consumed
+    bytes are collected and released in chunks of ``RELEASE_BYTES``.
+
+    Attributes
+    ----------
+    fileh : file object
+        The file we are reading.
+    released : integer
+        The position up to which the file has been released.
+    """
+
+    def __init__(self, fileh):
+        """Set up for releasing the given file."""
+        self.fileh = fileh
+        self.released = 0
+
+    def consumed(self, position, force=False):
+        """Mark the file as consumed up to a position.
+
+        Parameters
+        ----------
+        position : integer
+            The position up to which the file has been consumed.
+        force : boolean, optional
+            If True, the consumed bytes are released even if there
+            are less than ``RELEASE_BYTES`` of them.
+        """
+        length = position - self.released
+        if length >= RELEASE_BYTES or (force and length > 0):
+            release(self.fileh, self.released, length)
+            self.released = position
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for lazy, chunked, array views of TRR files.
+
+A section (e.g. the positions) over all frames is exposed as an
+array-like object which only reads the frames that are indexed. This
+object can be wrapped by `dask <https://dask.org>`_ with chunks of
+frames sized by a memory budget, and by
+`xarray <https://xarray.dev>`_ with time, atom and dimension
+coordinates. Both dask and xarray are optional dependencies.
+
+Useful methods defined here
+---------------------------
+
+to_dask
+    Create a chunked dask array for a section.
+
+to_xarray
+    Create an xarray Dataset for one or more sections.
+
+Useful classes defined here
+---------------------------
+
+TrrSectionArray
+    A lazy array-like view of a section over all frames.
+
+Example
+-------
+
+>>> positions = to_dask('traj.trr', 'x', chunk_bytes=256 * 1024**2)
+>>> msd = ((positions - positions[0])**2).sum(axis=-1).mean(axis=-1)
+>>> print(msd.compute())
+"""
+import numpy as np
+from .index import TrrIndex, section_shape
+try:
+    import dask.array as da
+    from dask.base import tokenize
+except ImportError:  # pragma: no cover
+    da = None
+try:
+    import xarray
+except ImportError:  # pragma: no cover
+    xarray = None
+
+
+CHUNK_BYTES = 128 * 1024**2
+
+
+class TrrSectionArray():
+    """A lazy array-like view of a section over all frames.
+
+    The array has the frames as the first dimension, e.g. the shape
+    ``(nframes, natoms, 3)`` for positions. Data is only read from the
+    file when the array is indexed. The file is memory mapped on first
+    use, and the object can be pickled (e.g. for sending to dask
+    workers) without the map.
+
+    Attributes
+    ----------
+    filename : string
+        The TRR file.
+    section : string
+        The section, e.g. ``'x'``.
+    index : object like :py:class:`.TrrIndex`
+        The index for the file.
+    shape : tuple of ints
+        The shape of the array.
+    dtype : object like :py:class:`numpy.dtype`
+        The data type of the array.
+    """
+
+    def __init__(self, filename, section, index=None):
+        """Set up the array.
+
+        Parameters
+        ----------
+        filename : string
+            The TRR file.
+        section : string
+            The section, e.g. ``'x'``.
+        index : object like :py:class:`.TrrIndex`, optional
+            A previously created index for the file.
+        """
+        if index is None:
+            index = TrrIndex.from_file(filename)
+        if len(index) == 0:
+            raise ValueError('No frames in "{}"'.format(filename))
+        self.filename = filename
+        self.section = section
+        self.index = index
+        first = index.headers[0]
+        shape = section_shape(first, section)
+        size = index.headers['{}_size'.format(section)]
+        if np.any(size == 0):
+            raise ValueError(
+                'Section "{}" is missing in some frames'.format(section)
+            )
+        if np.any(index.headers['natoms'] != first['natoms']):
+            raise ValueError('The number of atoms is not constant')
+        self.shape = (len(index),) + shape
+        self.dtype = np.dtype(np.float64)
+        self._raw = None
+
+    def __getstate__(self):
+        """Drop the memory map when pickling."""
+        state = self.__dict__.copy()
+        state['_raw'] = None
+        return state
+
+    @property
+    def ndim(self):
+        """The number of dimensions."""
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        """The number of bytes for the full (decoded) array."""
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        """Return the number of frames."""
+        return self.shape[0]
+
+    def _read(self, frames):
+        """Read the section for the given frames."""
+        if self._raw is None:
+            self._raw = np.memmap(self.filename, dtype=np.uint8, mode='r')
+        out = np.empty((len(frames),) + self.shape[1:], dtype=self.dtype)
+        for i, frame in enumerate(frames):
+            out[i] = self.index.section_view(self._raw, frame, self.section)
+        return out
+
+    def __getitem__(self, key):
+        """Read the frames selected by the key and apply the key."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        for pos, item in enumerate(key):
+            if item is Ellipsis:
+                fill = (slice(None),) * (self.ndim - len(key) + 1)
+                key = key[:pos] + fill + key[pos + 1:]
+                break
+        if not key:
+            key = (slice(None),)
+        first, rest = key[0], key[1:]
+        if isinstance(first, slice):
+            frames = range(len(self))[first]
+        elif (isinstance(first, (int, np.integer)) and
+              not isinstance(first, (bool, np.bool_))):
+            return self._read([range(len(self))[first]])[0][rest]
+        else:
+            # Only fancy indexing needs an array over all frames:
+            frames = np.arange(len(self))[first]
+            if np.ndim(frames) == 0:
+                return self._read([int(frames)])[0][rest]
+        return self._read(frames)[(slice(None),) + rest]
+
+    def __array__(self, dtype=None, copy=None):
+        """Read the full array."""
+        data = self[:]
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+
+def chunk_frames(array, chunk_bytes=CHUNK_BYTES):
+    """Return the number of frames per chunk for a memory budget.
+
+    Parameters
+    ----------
+    array : object like :py:class:`.TrrSectionArray`
+        The array to chunk.
+    chunk_bytes : integer, optional
+        The approximate number of bytes per chunk.
+
+    Returns
+    -------
+    out : integer
+        The number of frames in each chunk.
+    """
+    frame_bytes = array.nbytes // len(array)
+    return int(max(1, min(len(array), chunk_bytes // max(1, frame_bytes))))
+
+
+def to_dask(filename, section='x', index=None, chunk_bytes=CHUNK_BYTES):
+    """Create a chunked dask array for a section.
+
+    Each chunk is a block of consecutive frames, read via the offsets
+    in the index.
+
+    Parameters
+    ----------
+    filename : string
+        The TRR file.
+    section : string, optional
+        The section, e.g. ``'x'``.
+    index : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the file.
+    chunk_bytes : integer, optional
+        The approximate number of bytes per chunk.
+
+    Returns
+    -------
+    out : object like :py:class:`dask.array.Array`
+        The lazy array.
+    """
+    if da is None:
+        raise ImportError('to_dask requires the dask package')
+    array = TrrSectionArray(filename, section, index=index)
+    chunks = (chunk_frames(array, chunk_bytes),) + array.shape[1:]
+    name = 'pytrr-{}-{}'.format(
+        section, tokenize(filename, section, array.index.offsets)
+    )
+    return da.from_array(array, chunks=chunks, asarray=False, lock=False,
+                         name=name)
+
+
+def to_xarray(filename, sections=('x',), index=None,
+              chunk_bytes=CHUNK_BYTES):
+    """Create an xarray Dataset for one or more sections.
+
+    The Dataset has the dimensions ``time``, ``atom`` and ``dim`` for
+    coordinate sections and ``time``, ``vector`` and ``dim`` for
+    matrices (e.g. the box). If dask is installed, the variables are
+    lazy dask arrays, otherwise they are read into memory.
+
+    Parameters
+    ----------
+    filename : string
+        The TRR file.
+    sections : iterable of strings, optional
+        The sections to include.
+    index : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the file.
+    chunk_bytes : integer, optional
+        The approximate number of bytes per chunk.
+
+    Returns
+    -------
+    out : object like :py:class:`xarray.Dataset`
+        The Dataset.
+    """
+    if xarray is None:
+        raise ImportError('to_xarray requires the xarray package')
+    if index is None:
+        index = TrrIndex.from_file(filename)
+    data_vars = {}
+    for section in sections:
+        if da is not None:
+            data = to_dask(filename, section, index=index,
+                           chunk_bytes=chunk_bytes)
+        else:
+            data = np.asarray(TrrSectionArray(filename, section, index=index))
+        if section in ('box', 'vir', 'pres'):
+            dims = ('time', 'vector', 'dim')
+        else:
+            dims = ('time', 'atom', 'dim')
+        data_vars[section] = (dims, data)
+    coords = {
+        'time': index.headers['time'],
+        'step': ('time', index.headers['step']),
+        'dim': ['x', 'y', 'z'],
+    }
+    if index.headers['natoms'].size:
+        coords['atom'] = np.arange(index.headers['natoms'][0])
+    return xarray.Dataset(data_vars, coords=coords)
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for memory mapped access to TRR files.
+
+The file is memory mapped and the data sections are exposed as NumPy
+views with the byte order and precision used in the file. When the
+file is opened for writing, changes to the views are written directly
+to the file, so that editing a few frames only costs the bytes that
+are touched.
+
+Useful classes defined here
+---------------------------
+
+TrrMemmap
+    A class for memory mapped (and optionally writable) access to
+    the sections and header fields in a TRR file.
+
+MemmapFrame
+    A class for accessing a single frame in a :py:class:`.TrrMemmap`.
+
+Example
+-------
+
+>>> with TrrMemmap('traj.trr', mode='r+') as trr:
+>>>     frame = trr.frame(10)
+>>>     frame.v[:] = 0.0
+>>>     frame['time'] = 20.0
+"""
+import numpy as np
+from .index import TrrIndex, section_dtype
+from .pytrr import HEAD_ITEMS, SECTIONS
+
+
+# Header fields which can be changed without changing the layout:
+WRITABLE_FIELDS = ('step', 'time', 'lambda')
+
+
+class TrrMemmap():
+    """Memory mapped access to a TRR file.
+
+    Attributes
+    ----------
+    filename : string
+        The file we have mapped.
+    mode : string
+        The mode used for mapping the file, ``'r'`` for read only,
+        ``'r+'`` for writing changes to the file or ``'c'`` for
+        copy-on-write (changes are not written to the file).
+    index : object like :py:class:`.TrrIndex`
+        The index for the file.
+    raw : object like :py:class:`numpy.memmap`
+        The raw bytes of the file.
+    """
+
+    def __init__(self, filename, mode='r+', index=None):
+        """Map the file.
+
+        Parameters
+        ----------
+        filename : string
+            The file to map.
+        mode : string, optional
+            The mode to use, see :py:class:`numpy.memmap`.
+        index : object like :py:class:`.TrrIndex`, optional
+            A previously created index for the file. When the file is
+            opened for writing (``'r+'``), any checksums stored in it
+            are invalidated, since the views may change the file.
+        """
+        if mode not in ('r', 'r+', 'c'):
+            raise ValueError('Unsupported mode "{}"'.format(mode))
+        self.filename = filename
+        self.mode = mode
+        if index is None:
+            index = TrrIndex.from_file(filename)
+        self.index = index
+        self.raw = np.memmap(filename, dtype=np.uint8, mode=mode)
+        self._invalidate_checksums()
+
+    def _invalidate_checksums(self):
+        """Drop checksums in the index if the file may have changed."""
+        if self.mode == 'r+':
+            self.index.checksums = None
+
+    def __enter__(self):
+        """Return the map for use in a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Flush changes and release the map."""
+        self.close()
+
+    def __len__(self):
+        """Return the number of frames."""
+        return len(self.index)
+
+    def _check_frame(self, frame):
+        """Check that a frame exists and make it positive."""
+        if frame < 0:
+            frame += len(self)
+        if not 0 <= frame < len(self):
+            raise IndexError('Frame {} is out of range'.format(frame))
+        return frame
+
+    def section(self, frame, section):
+        """Return a view of a section in a frame.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+        section : string
+            The section, e.g. ``'box'`` or ``'x'``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray` or None
+            A view of the section, or None if it is not present.
+        """
+        frame = self._check_frame(frame)
+        header = self.index.headers[frame]
+        if section not in SECTIONS:
+            raise KeyError('Unknown section "{}"'.format(section))
+        if header['{}_size'.format(section)] == 0:
+            return None
+        return self.index.section_view(self.raw, frame, section)
+
+    def _field_location(self, frame, key):
+        """Return the offset and data type for a header field."""
+        header = self.index.headers[frame]
+        real = section_dtype(header)
+        data_offset = int(self.index.data_offsets[frame])
+        if key == 'time':
+            return data_offset - 2 * real.itemsize, real
+        if key == 'lambda':
+            return data_offset - real.itemsize, real
+        if key not in HEAD_ITEMS:
+            raise KeyError('Unknown header field "{}"'.format(key))
+        integer = np.dtype('{}i4'.format(header['endian']))
+        start = data_offset - 2 * real.itemsize - 13 * integer.itemsize
+        return start + HEAD_ITEMS.index(key) * integer.itemsize, integer
+
+    def header_field(self, frame, key):
+        """Return a view of a field in the header of a frame.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+        key : string
+            The header field, e.g. ``'step'`` or ``'time'``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            A zero-dimensional view of the field. It is read only
+            unless ``key`` is one of ``WRITABLE_FIELDS``.
+        """
+        frame = self._check_frame(frame)
+        offset, dtype = self._field_location(frame, key)
+        view = np.ndarray((), dtype=dtype, buffer=self.raw, offset=offset)
+        if key not in WRITABLE_FIELDS:
+            view.flags.writeable = False
+        return view
+
+    def set_header_field(self, frame, key, value):
+        """Change a field in the header of a frame.
+
+        The header stored in the index is updated too, and any
+        stored checksums are invalidated.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+        key : string
+            The field to change, one of ``WRITABLE_FIELDS``.
+        value : integer or float
+            The new value.
+        """
+        if key not in WRITABLE_FIELDS:
+            raise KeyError('Header field "{}" can not be changed'.format(key))
+        frame = self._check_frame(frame)
+        self.header_field(frame, key)[()] = value
+        self.index.headers.data[key][frame] = value
+        self.index.checksums = None
+
+    def frame(self, frame):
+        """Return a frame for accessing its sections and header.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+
+        Returns
+        -------
+        out : object like :py:class:`.MemmapFrame`
+            The frame.
+        """
+        return MemmapFrame(self, self._check_frame(frame))
+
+    def is_uniform(self):
+        """Check if all frames have the same layout and spacing.
+
+        Returns
+        -------
+        out : boolean
+            True if all frames have the same layout, so that sections
+            can be stacked with :py:meth:`.stacked`.
+        """
+        if len(self) < 2:
+            return True
+        data = self.index.headers.data
+        for key in ('natoms', 'endian', 'double') + tuple(
+                '{}_size'.format(i) for i in SECTIONS):
+            if np.any(data[key] != data[key][0]):
+                return False
+        strides = np.diff(self.index.offsets)
+        head = self.index.data_offsets - self.index.offsets
+        return bool(np.all(strides == strides[0]) and
+                    np.all(head == head[0]))
+
+    def _stride(self):
+        """Return the distance between frames for uniform files."""
+        if not self.is_uniform():
+            raise ValueError('The frames do not have a uniform layout')
+        if len(self) < 2:
+            return 0
+        return int(self.index.offsets[1] - self.index.offsets[0])
+
+    def stacked(self, section):
+        """Return a view of a section for all frames.
+
+        This requires that all frames have the same layout.
+
+        Parameters
+        ----------
+        section : string
+            The section, e.g. ``'x'``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            A strided view with the frames as the first dimension,
+            e.g. with shape ``(nframes, natoms, 3)`` for ``'x'``.
+        """
+        stride = self._stride()
+        first = self.section(0, section)
+        if first is None:
+            raise KeyError('Section "{}" is not present'.format(section))
+        return np.ndarray((len(self),) + first.shape, dtype=first.dtype,
+                          buffer=self.raw,
+                          offset=self.index.section_offset(0, section),
+                          strides=(stride,) + first.strides)
+
+    def column(self, key):
+        """Return a view of a header field for all frames.
+
+        This requires that all frames have the same layout.
+
+        Parameters
+        ----------
+        key : string
+            The header field, e.g. ``'time'``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            A strided view with one element per frame. It is read
+            only unless ``key`` is one of ``WRITABLE_FIELDS``. Note
+            that changes made through this view are not reflected in
+            the headers stored in the index, and that checksums
+            calculated for the index after the file was mapped are
+            only invalidated when the map is flushed.
+        """
+        stride = self._stride()
+        offset, dtype = self._field_location(0, key)
+        view = np.ndarray((len(self),), dtype=dtype, buffer=self.raw,
+                          offset=offset, strides=(stride,))
+        if key not in WRITABLE_FIELDS:
+            view.flags.writeable = False
+        return view
+
+    def flush(self):
+        """Write changes to the file.
+
+        Checksums stored in the index are invalidated, since they may
+        not match the changed file.
+        """
+        if self.mode == 'r+':
+            self.raw.flush()
+            self._invalidate_checksums()
+
+    def close(self):
+        """Flush changes and release the map."""
+        if self.raw is not None:
+            self.flush()
+            self.raw = None
+
+
+class MemmapFrame():
+    """A frame in a memory mapped TRR file.
+
+    The sections are available as attributes, e.g. ``frame.x``, and
+    the header fields with ``frame['step']``. Assigning to
+    ``frame['step']``, ``frame['time']`` or ``frame['lambda']``
+    changes the header in the file.
+
+    Attributes
+    ----------
+    trr : object like :py:class:`.TrrMemmap`
+        The mapped file.
+    number : integer
+        The index of the frame.
+    """
+
+    __slots__ = ('trr', 'number')
+
+    def __init__(self, trr, number):
+        """Set up the frame."""
+        self.trr = trr
+        self.number = number
+
+    def __getitem__(self, key):
+        """Return the value of a header field."""
+        return self.trr.header_field(self.number, key)[()]
+
+    def __setitem__(self, key, value):
+        """Change a header field."""
+        self.trr.set_header_field(self.number, key, value)
+
+    @property
+    def box(self):
+        """A view of the box matrix."""
+        return self.trr.section(self.number, 'box')
+
+    @property
+    def vir(self):
+        """A view of the virial matrix."""
+        return self.trr.section(self.number, 'vir')
+
+    @property
+    def pres(self):
+        """A view of the pressure matrix."""
+        return self.trr.section(self.number, 'pres')
+
+    @property
+    def x(self):
+        """A view of the coordinates."""
+        return self.trr.section(self.number, 'x')
+
+    @property
+    def v(self):
+        """A view of the velocities."""
+        return self.trr.section(self.number, 'v')
+
+    @property
+    def f(self):
+        """A view of the forces."""
+        return self.trr.section(self.number, 'f')
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for handling periodic boundaries for positions.
+
+The methods here work on batches of frames at once. Positions are
+given as arrays of shape ``(nframes, natoms, 3)`` and boxes as
+arrays of shape ``(nframes, 3, 3)``, where the rows of a box matrix
+are the box vectors (as stored in TRR files). Triclinic boxes are
+handled by working in fractional coordinates.
+
+Useful methods defined here
+---------------------------
+
+wrap_positions
+    Put positions back into the periodic box.
+
+center_positions
+    Center positions on a selection of atoms and wrap them.
+
+chunk_offsets
+    Obtain image offsets for stitching chunks unwrapped in parallel.
+
+Useful classes defined here
+---------------------------
+
+Unwrapper
+    A class for unwrapping positions across periodic boundaries,
+    keeping track of image counts between batches of frames.
+
+Example
+-------
+
+>>> unwrap = Unwrapper()
+>>> series = extract_timeseries('traj.trr', transform=unwrap)
+"""
+import numpy as np
+
+
+def _as_batch(x, box):
+    """Add a frame dimension to a single frame."""
+    x = np.asarray(x, dtype=np.float64)
+    box = np.asarray(box, dtype=np.float64)
+    single = x.ndim == 2
+    if single:
+        x = x[np.newaxis]
+    if box.ndim == 2:
+        box = np.broadcast_to(box, (len(x), 3, 3))
+    return x, box, single
+
+
+def to_fractional(x, box):
+    """Convert positions to fractional coordinates.
+
+    Parameters
+    ----------
+    x : object like :py:class:`numpy.ndarray`
+        The positions, shape ``(nframes, natoms, 3)``.
+    box : object like :py:class:`numpy.ndarray`
+        The boxes, shape ``(nframes, 3, 3)``.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.ndarray`
+        The fractional coordinates.
+    """
+    return np.matmul(x, np.linalg.inv(box))
+
+
+def to_cartesian(frac, box):
+    """Convert fractional coordinates to positions.
+
+    Parameters
+    ----------
+    frac : object like :py:class:`numpy.ndarray`
+        The fractional coordinates, shape ``(nframes, natoms, 3)``.
+    box : object like :py:class:`numpy.ndarray`
+        The boxes, shape ``(nframes, 3, 3)``.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.ndarray`
+        The positions.
+    """
+    return np.matmul(frac, box)
+
+
+def wrap_positions(x, box):
+    """Put positions back into the periodic box.
+
+    Parameters
+    ----------
+    x : object like :py:class:`numpy.ndarray`
+        The positions, shape ``(nframes, natoms, 3)`` or
+        ``(natoms, 3)``.
+    box : object like :py:class:`numpy.ndarray`
+        The boxes, shape ``(nframes, 3, 3)`` or ``(3, 3)``.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.ndarray`
+        The wrapped positions.
+    """
+    x, box, single = _as_batch(x, box)
+    frac = to_fractional(x, box)
+    frac -= np.floor(frac)
+    wrapped = to_cartesian(frac, box)
+    return wrapped[0] if single else wrapped
+
+
+def center_positions(x, box, selection):
+    """Center positions on a selection and put them into the box.
+
+    The center of the selection is obtained as a circular mean of the
+    fractional coordinates, so that it is not affected by the
+    selection being split across the periodic boundaries.
+
+    Parameters
+    ----------
+    x : object like :py:class:`numpy.ndarray`
+        The positions, shape ``(nframes, natoms, 3)`` or
+        ``(natoms, 3)``.
+    box : object like :py:class:`numpy.ndarray`
+        The boxes, shape ``(nframes, 3, 3)`` or ``(3, 3)``.
+    selection : iterable of ints or slice
+        The atoms to center on.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.ndarray`
+        The centered and wrapped positions.
+    """
+    x, box, single = _as_batch(x, box)
+    frac = to_fractional(x, box)
+    angle = 2.0 * np.pi * frac[:, selection]
+    center = np.arctan2(np.sin(angle).mean(axis=1),
+                        np.cos(angle).mean(axis=1)) / (2.0 * np.pi)
+    frac = frac - center[:, np.newaxis] + 0.5
+    frac -= np.floor(frac)
+    centered = to_cartesian(frac, box)
+    return centered[0] if single else centered
+
+
+class Unwrapper():
+    """Unwrap positions across periodic boundaries.
+
+    The unwrapper assumes that atoms do not move more than half a
+    box length between consecutive frames. It keeps the image counts
+    between calls so that a trajectory can be unwrapped in batches.
+
+    Attributes
+    ----------
+    first : object like :py:class:`numpy.ndarray`
+        The fractional coordinates of the first frame seen.
+    previous : object like :py:class:`numpy.ndarray`
+        The fractional coordinates of the last frame seen.
+    images : object like :py:class:`numpy.ndarray`
+        The image counts (integers) for the last frame seen.
+    """
+
+    def __init__(self):
+        """Set up the unwrapper, with no frames seen."""
+        self.first = None
+        self.previous = None
+        self.images = None
+
+    def __call__(self, x, box):
+        """Unwrap a batch of frames.
+
+        Parameters
+        ----------
+        x : object like :py:class:`numpy.ndarray`
+            The positions, shape ``(nframes, natoms, 3)`` or
+            ``(natoms, 3)``.
+        box : object like :py:class:`numpy.ndarray`
+            The boxes, shape ``(nframes, 3, 3)`` or ``(3, 3)``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            The unwrapped positions.
+        """
+        x, box, single = _as_batch(x, box)
+        if len(x) == 0:
+            return x
+        frac = to_fractional(x, box)
+        if self.previous is None:
+            self.first = frac[0].copy()
+            self.previous = frac[0]
+            self.images = np.zeros(frac.shape[1:])
+        jumps = np.diff(np.concatenate((self.previous[np.newaxis], frac)),
+                        axis=0)
+        shifts = self.images - np.cumsum(np.round(jumps), axis=0)
+        self.previous = frac[-1].copy()
+        self.images = shifts[-1].copy()
+        unwrapped = to_cartesian(frac + shifts, box)
+        return unwrapped[0] if single else unwrapped
+
+
+def chunk_offsets(unwrappers):
+    """Get image offsets for stitching chunks unwrapped independently.
+
+    When consecutive chunks of a trajectory are unwrapped in parallel,
+    each with its own :py:class:`.Unwrapper`, the image counts in a
+    chunk are relative to its first frame. This method calculates the
+    image offsets to add to each chunk to make them consistent.
+
+    Parameters
+    ----------
+    unwrappers : list of objects like :py:class:`.Unwrapper`
+        The unwrappers used for consecutive chunks.
+
+    Returns
+    -------
+    offsets : list of objects like :py:class:`numpy.ndarray`
+        The image offsets for each chunk. They can be applied with
+        :py:func:`.apply_image_offset`.
+    """
+    offsets = []
+    offset = None
+    previous = None
+    for unwrap in unwrappers:
+        if offset is None:
+            offset = np.zeros_like(unwrap.first)
+        else:
+            jump = np.round(unwrap.first - previous.previous)
+            offset = offset + previous.images - jump
+        offsets.append(offset)
+        previous = unwrap
+    return offsets
+
+
+def apply_image_offset(x, box, offset):
+    """Shift positions by a number of periodic images.
+
+    Parameters
+    ----------
+    x : object like :py:class:`numpy.ndarray`
+        The positions, shape ``(nframes, natoms, 3)`` or
+        ``(natoms, 3)``.
+    box : object like :py:class:`numpy.ndarray`
+        The boxes, shape ``(nframes, 3, 3)`` or ``(3, 3)``.
+    offset : object like :py:class:`numpy.ndarray`
+        The image offsets, shape ``(natoms, 3)``.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.ndarray`
+        The shifted positions.
+    """
+    x, box, single = _as_batch(x, box)
+    shifted = x + to_cartesian(offset[np.newaxis], box)
+    return shifted[0] if single else shifted
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for reading TRR files from several threads.
+
+:py:class:`.GroTrrReader` reads through a file object and keeps track
+of the current frame, so it can not be shared between threads. The
+reader defined here uses the offsets in an index and reads each frame
+with positional reads (:py:func:`os.preadv` or :py:func:`os.pread`)
+from a single file descriptor. Reading does not change any state in
+the reader, so one reader can be used by many threads at the same
+time. The reads and the decoding release the GIL, so that frames are
+read and decoded in parallel.
+
+Useful classes defined here
+---------------------------
+
+PositionalTrrReader
+    A thread-safe reader for frames at given positions.
+
+Example
+-------
+
+>>> with PositionalTrrReader('traj.trr') as trr:
+>>>     with ThreadPoolExecutor(max_workers=8) as pool:
+>>>         means = pool.map(lambda i: trr.read_section(i, 'x').mean(),
+>>>                          range(len(trr)))
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+from .index import TrrIndex, section_dtype, section_shape
+from .iohints import advise_file, will_need
+from .pytrr import DATA_ITEMS, SECTIONS
+
+
+class PositionalTrrReader():
+    """Read frames from a TRR file with positional reads.
+
+    Attributes
+    ----------
+    filename : string
+        The file we read from.
+    index : object like :py:class:`.TrrIndex`
+        The index for the file.
+    fileno : integer
+        The file descriptor we read from.
+    """
+
+    def __init__(self, filename, index=None, access=None):
+        """Open the file.
+
+        Parameters
+        ----------
+        filename : string
+            The file to read from.
+        index : object like :py:class:`.TrrIndex`, optional
+            A previously created index for the file.
+        access : string, optional
+            The expected access pattern, given as a hint to the
+            operating system, see :py:mod:`pytrr.iohints`.
+        """
+        if index is None:
+            index = TrrIndex.from_file(filename)
+        self.filename = filename
+        self.index = index
+        self.fileno = os.open(filename, os.O_RDONLY)
+        if access is not None:
+            advise_file(self.fileno, access)
+
+    def __enter__(self):
+        """Return the reader for use in a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the file."""
+        self.close()
+
+    def __len__(self):
+        """Return the number of frames."""
+        return len(self.index)
+
+    def close(self):
+        """Close the file."""
+        if self.fileno is not None:
+            os.close(self.fileno)
+            self.fileno = None
+
+    def _pread_into(self, arrays, offset):
+        """Read consecutive bytes at an offset into arrays."""
+        size = sum(i.nbytes for i in arrays)
+        if hasattr(os, 'preadv'):
+            nbytes = os.preadv(self.fileno, arrays, offset)
+        else:  # pragma: no cover
+            buff = os.pread(self.fileno, size, offset)
+            nbytes = len(buff)
+            if nbytes == size:
+                start = 0
+                for array in arrays:
+                    array.reshape(-1)[:] = np.frombuffer(
+                        buff, dtype=array.dtype, count=array.size,
+                        offset=start,
+                    )
+                    start += array.nbytes
+        if nbytes != size:
+            raise EOFError(
+                'Expected {} bytes at offset {}, got {}'.format(size, offset,
+                                                                nbytes)
+            )
+
+    def header(self, frame):
+        """Return the header for a frame.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+
+        Returns
+        -------
+        out : object like :py:class:`.TrrHeader`
+            The header of the frame.
+        """
+        return self.index.headers[frame]
+
+    def read_frame(self, frame, sections=None):
+        """Read a frame.
+
+        Sections which follow each other in the file are read with
+        a single positional read, directly into the arrays.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+        sections : iterable of strings, optional
+            The sections to read. If not given, all sections present
+            in the frame are read.
+
+        Returns
+        -------
+        out[0] : object like :py:class:`.TrrHeader`
+            The header of the frame.
+        out[1] : dict
+            The data read, as returned by :py:func:`.read_trr_data`.
+        """
+        header = self.index.headers[frame]
+        dtype = section_dtype(header)
+        offset = int(self.index.data_offsets[frame])
+        # Collect runs of requested sections which follow each other:
+        runs = []
+        previous = None
+        for key, section in zip(DATA_ITEMS, SECTIONS):
+            size = header[key]
+            if size != 0 and (sections is None or section in sections):
+                array = np.empty(section_shape(header, section), dtype=dtype)
+                if previous == offset:
+                    runs[-1][1].append((section, array))
+                else:
+                    runs.append((offset, [(section, array)]))
+                previous = offset + size
+            offset += size
+        data = {}
+        for start, members in runs:
+            self._pread_into([i[1] for i in members], start)
+            for section, array in members:
+                data[section] = array.astype(np.float64)
+        return header, data
+
+    def read_section(self, frame, section):
+        """Read a single section of a frame.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+        section : string
+            The section to read, e.g. ``'x'``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            The data for the section.
+
+        Raises
+        ------
+        KeyError
+            If the section is not present in the frame.
+        """
+        header = self.index.headers[frame]
+        array = np.empty(section_shape(header, section),
+                         dtype=section_dtype(header))
+        self._pread_into([array],
+                         self.index.section_offset(frame, section))
+        return array.astype(np.float64)
+
+    def read_frames(self, frames=None, sections=None, workers=None):
+        """Read several frames using a pool of threads.
+
+        When specific frames are requested, the operating system is
+        told that they will be needed (``POSIX_FADV_WILLNEED``), so that
+        it can start reading all of them before the threads get to them.
+
+        Parameters
+        ----------
+        frames : iterable of ints, optional
+            The frames to read. If not given, all frames are read.
+        sections : iterable of strings, optional
+            The sections to read, see :py:meth:`.read_frame`.
+        workers : integer, optional
+            The number of threads to use. If not given, the default
+            for :py:class:`concurrent.futures.ThreadPoolExecutor` is
+            used.
+
+        Returns
+        -------
+        out : list of dicts
+            The data for each frame.
+        """
+        if frames is None:
+            frames = range(len(self))
+        else:
+            frames = list(frames)
+            for frame in frames:
+                offset = int(self.index.data_offsets[frame])
+                will_need(self.fileno, offset,
+                          self.index.frame_end(frame) - offset)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return [i[1] for i in pool.map(
+                lambda frame: self.read_frame(frame, sections=sections),
+                frames,
+            )]
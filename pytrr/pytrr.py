@@ -22,6 +22,9 @@ skip_trr_data
 write_trr_frame
     Write data to a TRR file.
 
+get_codec
+    Get a cached codec with precompiled formats for a frame layout.
+
 Useful classes defined here
 ---------------------------
 
@@ -29,6 +32,13 @@ GroTrrReader
     A class for opening and reading TRR files in a "file-like"
     manner (see the example below).
 
+TrrFrame
+    A class for a frame where the data is only read when accessed.
+
+TrrCodec
+    A class holding precompiled formats for reading and writing
+    frames with a given layout.
+
 Example
 -------
 
@@ -37,9 +47,21 @@ Example
 >>>        print(header['step'], header['time'])
 >>>        data = trrfile.get_data()
 >>>        print(data['x'][0])
+
+The data can also be read on demand:
+
+>>> with GroTrrReader('traj.trr') as trrfile:
+>>>    for frame in trrfile.frames():
+>>>        if frame['time'] > 10.0:
+>>>            print(frame.x[0])
 """
+from collections.abc import Mapping
+import functools
 import struct
+import sys
 import numpy as np
+from .iohints import advise_file, check_access, CacheReleaser
+from .storage import is_path, open_file
 
 
 GROMACS_MAGIC = 1993
@@ -49,11 +71,24 @@ TRR_VERSION_B = b'GMX_trn_file'
 SIZE_FLOAT = struct.calcsize('f')
 SIZE_DOUBLE = struct.calcsize('d')
 HEAD_FMT = '{}13i'
+MAGIC_FMT = '>1i'
 HEAD_ITEMS = ('ir_size', 'e_size', 'box_size', 'vir_size', 'pres_size',
               'top_size', 'sym_size', 'x_size', 'v_size', 'f_size',
               'natoms', 'step', 'nre', 'time', 'lambda')
 DATA_ITEMS = ('box_size', 'vir_size', 'pres_size',
               'x_size', 'v_size', 'f_size')
+SECTIONS = tuple(key.split('_')[0] for key in DATA_ITEMS)
+HEADER_KEYS = HEAD_ITEMS + ('endian', 'double')
+HEADER_DTYPE = np.dtype(
+    [(key, np.int32) for key in HEAD_ITEMS[:13]] +
+    [('time', np.float64), ('lambda', np.float64), ('endian', 'U1'),
+     ('double', np.bool_)]
+)
+# The byte order of this machine, used when storing headers written
+# with the native byte order (endian None or '='):
+NATIVE_ENDIAN = '<' if sys.byteorder == 'little' else '>'
+STRUCT_CACHE_SIZE = 128
+CODEC_CACHE_SIZE = 64
 
 
 def swap_integer(integer):
@@ -72,6 +107,220 @@ def swap_endian(endian):
         raise ValueError('Undefined swap!')
 
 
+@functools.lru_cache(maxsize=STRUCT_CACHE_SIZE)
+def get_struct(fmt):
+    """Return a compiled :py:class:`struct.Struct` for a format.
+
+    The compiled structures are memoized, so that repeated calls with
+    the same format do not parse the format again.
+
+    Parameters
+    ----------
+    fmt : string
+        The format to compile.
+
+    Returns
+    -------
+    out : object like :py:class:`struct.Struct`
+        The compiled format.
+    """
+    return struct.Struct(fmt)
+
+
+class TrrCodec():
+    """Precompiled formats for a given layout of TRR frames.
+
+    A codec is defined by the byte order, the precision, the number of
+    atoms and the data sections present in a frame. Codecs should be
+    obtained by :py:func:`.get_codec` which will cache them.
+
+    Attributes
+    ----------
+    endian : string
+        The byte order.
+    double : boolean
+        True if the real numbers are stored in double precision.
+    natoms : integer
+        The number of atoms.
+    sections : tuple of strings
+        The data sections present, e.g. ``('box', 'x', 'v')``.
+    dtype : object like :py:class:`numpy.dtype`
+        The data type for real numbers, in the byte order of the file.
+    slen : object like :py:class:`struct.Struct`
+        Format for the two integers giving the version string length.
+    version : object like :py:class:`struct.Struct`
+        Format for the version string.
+    head : object like :py:class:`struct.Struct`
+        Format for the integer part of the header.
+    real2 : object like :py:class:`struct.Struct`
+        Format for the time and lambda values of the header.
+    header : object like :py:class:`struct.Struct`
+        Format for a complete header.
+    header_size : integer
+        The size (in bytes) of a complete header.
+    matrix_size : integer
+        The size (in bytes) of a matrix section.
+    coord_size : integer
+        The size (in bytes) of a coordinate section.
+    sizes : dict of ints
+        The size (in bytes) of each section in ``sections``.
+    frame_size : integer
+        The size (in bytes) of a frame with the given sections.
+    """
+
+    def __init__(self, endian, double, natoms=0, sections=()):
+        """Compile the formats.
+
+        Parameters
+        ----------
+        endian : string
+            The byte order.
+        double : boolean
+            True if the real numbers are stored in double precision.
+        natoms : integer, optional
+            The number of atoms.
+        sections : tuple of strings, optional
+            The data sections present.
+        """
+        self.endian = endian
+        self.double = double
+        self.natoms = natoms
+        self.sections = sections
+        real = 'd' if double else 'f'
+        self.dtype = np.dtype('{}{}'.format(endian, real))
+        slen = len(TRR_VERSION_B) + 1
+        self.slen = get_struct('{}2i'.format(endian))
+        self.version = get_struct('{}{}s'.format(endian, slen - 1))
+        self.head = get_struct(HEAD_FMT.format(endian))
+        self.real2 = get_struct('{}2{}'.format(endian, real))
+        self.header = get_struct(
+            '{}1i2i{}s13i2{}'.format(endian, slen - 1, real)
+        )
+        self.header_size = self.header.size
+        self.matrix_size = DIM * DIM * self.dtype.itemsize
+        self.coord_size = natoms * DIM * self.dtype.itemsize
+        self.sizes = {}
+        for key in sections:
+            if key in ('box', 'vir', 'pres'):
+                self.sizes[key] = self.matrix_size
+            else:
+                self.sizes[key] = self.coord_size
+        self.frame_size = self.header_size + sum(self.sizes.values())
+
+    def __reduce__(self):
+        """Pickle the codec by its layout."""
+        return (get_codec, (self.endian, self.double, self.natoms,
+                            self.sections))
+
+    def pack_header(self, header):
+        """Pack a header into bytes.
+
+        Parameters
+        ----------
+        header : dict
+            The header to pack.
+
+        Returns
+        -------
+        out : bytes
+            The packed header.
+        """
+        slen = len(TRR_VERSION_B) + 1
+        head = [header[key] for key in HEAD_ITEMS[:13]]
+        return self.header.pack(GROMACS_MAGIC, slen, slen - 1,
+                                TRR_VERSION_B, *head,
+                                header['time'], header['lambda'])
+
+    def decode(self, buff, shape):
+        """Decode real numbers from bytes.
+
+        Parameters
+        ----------
+        buff : bytes
+            The bytes to decode.
+        shape : tuple of ints
+            The shape of the decoded array.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            The decoded numbers, in native double precision.
+        """
+        mat = np.frombuffer(buff, dtype=self.dtype).astype(np.float64)
+        mat.shape = shape
+        return mat
+
+
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
+def get_codec(endian, double, natoms=0, sections=()):
+    """Return a (cached) codec for a frame layout.
+
+    Parameters
+    ----------
+    endian : string
+        The byte order.
+    double : boolean
+        True if the real numbers are stored in double precision.
+    natoms : integer, optional
+        The number of atoms.
+    sections : tuple of strings, optional
+        The data sections present in the frames.
+
+    Returns
+    -------
+    out : object like :py:class:`.TrrCodec`
+        The codec for the given layout.
+    """
+    return TrrCodec(endian, double, natoms=natoms, sections=sections)
+
+
+def header_sections(header):
+    """Return the data sections present according to a header.
+
+    Parameters
+    ----------
+    header : dict
+        The header read from the TRR file.
+
+    Returns
+    -------
+    out : tuple of strings
+        The sections present, e.g. ``('box', 'x', 'v')``.
+    """
+    return tuple(name for key, name in zip(DATA_ITEMS, SECTIONS)
+                 if header[key] != 0)
+
+
+def read_buff(fileh, size):
+    """Read a given number of bytes from a file handle.
+
+    Parameters
+    ----------
+    fileh : file object
+        The file handle to read from.
+    size : integer
+        The number of bytes to read.
+
+    Returns
+    -------
+    out : bytes
+        The bytes read.
+
+    Raises
+    ------
+    EOFError
+        If we are at the end of the file.
+    struct.error
+        If the file ended before all bytes were read.
+    """
+    buff = fileh.read(size)
+    if not buff and size > 0:
+        raise EOFError
+    if len(buff) != size:
+        raise struct.error('unpack requires a buffer of {} bytes'.format(size))
+    return buff
+
+
 def read_struct_buff(fileh, fmt):
     """Unpack from a filehandle with a given format.
 
@@ -79,7 +328,7 @@ def read_struct_buff(fileh, fmt):
     ----------
     fileh : file object
         The file handle to unpack from.
-    fmt : string
+    fmt : string or object like :py:class:`struct.Struct`
         The format to use for unpacking.
 
     Returns
@@ -93,11 +342,13 @@ def read_struct_buff(fileh, fmt):
         We will raise an EOFError if `fileh.read()` attempts to read
         past the end of the file.
     """
-    buff = fileh.read(struct.calcsize(fmt))
+    if not isinstance(fmt, struct.Struct):
+        fmt = get_struct(fmt)
+    buff = fileh.read(fmt.size)
     if not buff:
         raise EOFError
     else:
-        return struct.unpack(fmt, buff)
+        return fmt.unpack(buff)
 
 
 def read_matrix(fileh, endian, double):
@@ -121,16 +372,9 @@ def read_matrix(fileh, endian, double):
     mat : numpy.array
         The matrix as an numpy array.
     """
-    if double:
-        fmt = '{}{}d'.format(endian, DIM*DIM)
-    else:
-        fmt = '{}{}f'.format(endian, DIM*DIM)
-    read = read_struct_buff(fileh, fmt)
-    mat = np.zeros((DIM, DIM))
-    for i in range(DIM):
-        for j in range(DIM):
-            mat[i, j] = read[i*DIM + j]
-    return mat
+    codec = get_codec(endian, double)
+    buff = read_buff(fileh, codec.matrix_size)
+    return codec.decode(buff, (DIM, DIM))
 
 
 def read_coord(fileh, endian, double, natoms):
@@ -158,14 +402,126 @@ def read_coord(fileh, endian, double, natoms):
         The coordinates as a numpy array. It will have
         ``natoms`` rows and ``DIM`` columns.
     """
-    if double:
-        fmt = '{}{}d'.format(endian, natoms * DIM)
+    codec = get_codec(endian, double, natoms)
+    buff = read_buff(fileh, codec.coord_size)
+    return codec.decode(buff, (natoms, DIM))
+
+
+class TrrHeader(Mapping):
+    """A compact, read-only, header for a frame in a TRR file.
+
+    The header behaves as a read-only dictionary, e.g.
+    ``header['step']``, ``dict(header)`` and comparisons with
+    dictionaries work as expected. The items can also be accessed as
+    attributes, e.g. ``header.step``. The keys are given by
+    ``HEADER_KEYS``, and the values are stored in a tuple.
+    """
+
+    __slots__ = ('_values',)
+    _positions = {key: i for i, key in enumerate(HEADER_KEYS)}
+
+    def __init__(self, values):
+        """Create the header from the values for ``HEADER_KEYS``."""
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        """Return an item by key."""
+        try:
+            return self._values[self._positions[key]]
+        except IndexError:
+            raise KeyError(key)
+
+    def __getattr__(self, key):
+        """Return an item as an attribute."""
+        if key.startswith('_'):
+            raise AttributeError(key)
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __contains__(self, key):
+        """Check if the header has a key."""
+        return self._positions.get(key, len(self._values)) < len(self._values)
+
+    def __iter__(self):
+        """Iterate over the keys."""
+        return iter(HEADER_KEYS[:len(self._values)])
+
+    def __len__(self):
+        """Return the number of items."""
+        return len(self._values)
+
+    def __reduce__(self):
+        """Return the arguments needed for pickling."""
+        return (self.__class__, (self._values,))
+
+    def __repr__(self):
+        """Show the header as a dictionary."""
+        return '{}({})'.format(self.__class__.__name__, self.asdict())
+
+    def asdict(self):
+        """Return the header as a dictionary."""
+        return dict(zip(HEADER_KEYS, self._values))
+
+
+def _header_values(header):
+    """Return the values of a header, with an explicit byte order."""
+    if isinstance(header, TrrHeader):
+        values = header._values
     else:
-        fmt = '{}{}f'.format(endian, natoms * DIM)
-    read = read_struct_buff(fileh, fmt)
-    mat = np.array(read)
-    mat.shape = (natoms, DIM)
-    return mat
+        values = tuple(header[key] for key in HEADER_KEYS)
+    if values[-2] in (None, '='):
+        values = values[:-2] + (NATIVE_ENDIAN,) + values[-1:]
+    return values
+
+
+class TrrHeaderArray():
+    """A sequence of headers, stored in a NumPy structured array.
+
+    Items are returned as :py:class:`.TrrHeader` objects when indexed
+    by an integer, while indexing by a key returns the column for all
+    the headers, e.g. ``headers['time']``.
+
+    Attributes
+    ----------
+    data : object like :py:class:`numpy.ndarray`
+        The headers, with the data type ``HEADER_DTYPE``.
+    """
+
+    def __init__(self, headers=()):
+        """Store the headers.
+
+        Parameters
+        ----------
+        headers : iterable of headers or object like :py:class:`numpy.ndarray`
+            The headers to store, either as header objects, or as a
+            structured array with the data type ``HEADER_DTYPE``.
+        """
+        if isinstance(headers, np.ndarray):
+            self.data = headers.astype(HEADER_DTYPE, copy=False)
+        else:
+            self.data = np.array(
+                [_header_values(header) for header in headers],
+                dtype=HEADER_DTYPE,
+            )
+
+    def __len__(self):
+        """Return the number of headers."""
+        return len(self.data)
+
+    def __getitem__(self, key):
+        """Return a header, a column or a new array of headers."""
+        if isinstance(key, str):
+            return self.data[key]
+        if isinstance(key, (int, np.integer)):
+            return TrrHeader(self.data[key].item())
+        return TrrHeaderArray(self.data[key])
+
+    def __iter__(self):
+        """Iterate over the headers."""
+        for values in self.data.tolist():
+            yield TrrHeader(values)
 
 
 def is_double(header):
@@ -212,12 +568,12 @@ def read_trr_header(fileh):
 
     Returns
     -------
-    header : dict
+    header : object like :py:class:`.TrrHeader`
         The header read from the file.
     """
     endian = '>'
 
-    magic = read_struct_buff(fileh, '{}1i'.format(endian))[0]
+    magic = read_struct_buff(fileh, MAGIC_FMT)[0]
 
     if magic == GROMACS_MAGIC:
         pass
@@ -225,30 +581,21 @@ def read_trr_header(fileh):
         magic = swap_integer(magic)
         endian = swap_endian(endian)
 
-    slen = read_struct_buff(fileh, '{}2i'.format(endian))
-    raw = read_struct_buff(fileh, '{}{}s'.format(endian, slen[0]-1))
+    codec = get_codec(endian, False)
+    slen = read_struct_buff(fileh, codec.slen)
+    if slen[0] - 1 == codec.version.size:
+        raw = read_struct_buff(fileh, codec.version)
+    else:
+        raw = read_struct_buff(fileh, '{}{}s'.format(endian, slen[0]-1))
     version = raw[0].split(b'\0', 1)[0].decode('utf-8')
     if not version == TRR_VERSION:
         raise ValueError('Unknown format')
 
-    head_fmt = HEAD_FMT.format(endian)
-    head_s = read_struct_buff(fileh, head_fmt)
-    header = {}
-    for i, val in enumerate(head_s):
-        key = HEAD_ITEMS[i]
-        header[key] = val
+    head_s = read_struct_buff(fileh, codec.head)
     # The next are either floats or double
-    double = is_double(header)
-    if double:
-        fmt = '{}2d'.format(endian)
-    else:
-        fmt = '{}2f'.format(endian)
-    header_r = read_struct_buff(fileh, fmt)
-    header['time'] = header_r[0]
-    header['lambda'] = header_r[1]
-    header['endian'] = endian
-    header['double'] = double
-    return header
+    double = is_double(TrrHeader(head_s))
+    header_r = read_struct_buff(fileh, get_codec(endian, double).real2)
+    return TrrHeader(head_s + header_r + (endian, double))
 
 
 def skip_trr_data(fileh, header):
@@ -308,59 +655,27 @@ def read_trr_data(fileh, header):
     return data
 
 
-def _write_trr_header(outfile, header, floatfmt, endian=None):
-    """Helper method for writing a header to a TRR file.
-
-    Parameters
-    ----------
-    outfile : filehandle
-        The file we can write to.
-    header : dict
-        The header data for the TRR file.
-    floatfmt : string
-        The string which gives the format for floats. It should indicate
-        if we are writing for double or single precision.
-    endian : string, optional
-        Can be used to force endianess.
-    """
-    slen = (13, 12)
-    fmt = ['1i', '2i', '{}s'.format(slen[0] - 1), '13i']
-    if endian:
-        fmt = [endian + i for i in fmt]
-    outfile.write(struct.pack(fmt[0], GROMACS_MAGIC))
-    outfile.write(struct.pack(fmt[1], *slen))
-    outfile.write(struct.pack(fmt[2], TRR_VERSION_B))
-    head = [header[key] for key in HEAD_ITEMS[:13]]
-    outfile.write(struct.pack(fmt[3], *head))
-    outfile.write(struct.pack(floatfmt.format(1), header['time']))
-    outfile.write(struct.pack(floatfmt.format(1), header['lambda']))
-
-
-def write_trr_frame(filename, data, endian=None, double=False, append=False):
-    """Write data in TRR format to a file.
+def _make_header(data, endian=None, double=False):
+    """Create the header for writing a frame.
 
     Parameters
     ----------
-    filename : string
-        The file we will write to.
     data : dict
-        The data we will write to the file.
+        The data we will write.
     endian : string, optional
-        Select the byte order; big-endian or little-endian. If not
-        specified, the native byte order will be used.
+        The byte order we will write in.
     double : boolean, optional
         If True, we will write in double precision.
-    append : boolean, optional
-        If True, we will append to the given file.
+
+    Returns
+    -------
+    header : dict
+        The header for the frame.
     """
     if double:
         size = SIZE_DOUBLE
-        floatfmt = '{}d'
     else:
         size = SIZE_FLOAT
-        floatfmt = '{}f'
-    if endian:
-        floatfmt = endian + floatfmt
 
     header = {}
     for key in HEAD_ITEMS:
@@ -376,30 +691,218 @@ def write_trr_frame(filename, data, endian=None, double=False, append=False):
     header['double'] = double
     header['time'] = data['time']
     header['lambda'] = data['lambda']
+    return header
+
+
+def _encode_frame(header, data, codec):
+    """Encode a frame to bytes.
+
+    Parameters
+    ----------
+    header : dict
+        The header for the frame.
+    data : dict
+        The data for the frame.
+    codec : object like :py:class:`.TrrCodec`
+        The codec giving the layout of the frame.
+
+    Returns
+    -------
+    out : bytes
+        The encoded frame.
+    """
+    parts = [codec.pack_header(header)]
+    for key in codec.sections:
+        # Note: We assume that the data is a numpy array, and that
+        # we can find it as data['x'], data['v'], ... and so on.
+        parts.append(np.asarray(data[key], dtype=codec.dtype).tobytes())
+    return b''.join(parts)
+
+
+def write_trr_frame(filename, data, endian=None, double=False, append=False):
+    """Write data in TRR format to a file.
+
+    Parameters
+    ----------
+    filename : string
+        The file we will write to.
+    data : dict
+        The data we will write to the file.
+    endian : string, optional
+        Select the byte order; big-endian or little-endian. If not
+        specified, the native byte order will be used.
+    double : boolean, optional
+        If True, we will write in double precision.
+    append : boolean, optional
+        If True, we will append to the given file.
+    """
+    header = _make_header(data, endian=endian, double=double)
+    codec = get_codec(endian or '=', double, data['natoms'],
+                      header_sections(header))
 
     if append:
         mode = 'ab'
     else:
         mode = 'wb'
     with open(filename, mode) as outfile:
-        _write_trr_header(outfile, header, floatfmt, endian=endian)
-        for key in DATA_ITEMS:
-            if header[key] != 0:
-                # Note: We assume that the data is a numpy array, and that
-                # we can find it as data['x'], data['v'], ... and so on.
-                matrix = data[key.split('_')[0]]
-                fmt = floatfmt.format(matrix.size)
-                outfile.write(struct.pack(fmt, *matrix.flatten()))
+        outfile.write(_encode_frame(header, data, codec))
     return header
 
 
+class TrrFrame():
+    """A frame in a TRR file, where the data is read on demand.
+
+    The frame only holds the header and the position of the data in
+    the file. A data section is read and decoded the first time it is
+    accessed, e.g. by ``frame.x``, and it is then cached. Sections not
+    present in the frame are returned as None.
+
+    Attributes
+    ----------
+    fileh : file object
+        The file handle to read the data from. It must be open when
+        data is accessed.
+    header : dict
+        The header read for the frame.
+    offset : integer
+        The byte offset for the start of the data in the frame.
+    """
+
+    __slots__ = ('fileh', 'header', 'offset', '_cache')
+
+    def __init__(self, fileh, header, offset):
+        """Set up the frame.
+
+        Parameters
+        ----------
+        fileh : file object
+            The file handle to read the data from.
+        header : dict
+            The header read for the frame.
+        offset : integer
+            The byte offset for the start of the data in the frame.
+        """
+        self.fileh = fileh
+        self.header = header
+        self.offset = offset
+        self._cache = None
+
+    def __getitem__(self, key):
+        """Look up an item in the header."""
+        return self.header[key]
+
+    def section_offset(self, section):
+        """Return the byte offset for a data section in the frame.
+
+        Parameters
+        ----------
+        section : string
+            The section to locate, e.g. ``'box'`` or ``'x'``.
+
+        Returns
+        -------
+        out : integer
+            The byte offset for the section.
+        """
+        offset = self.offset
+        for key, name in zip(DATA_ITEMS, SECTIONS):
+            if name == section:
+                return offset
+            offset += self.header[key]
+        raise KeyError('Unknown section "{}"'.format(section))
+
+    def get_section(self, section):
+        """Read a section (if needed) and return it.
+
+        Parameters
+        ----------
+        section : string
+            The section to read, e.g. ``'box'`` or ``'x'``.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray` or None
+            The data for the section, or None if the section is
+            not present in the frame.
+        """
+        if self._cache is None:
+            self._cache = {}
+        if section in self._cache:
+            return self._cache[section]
+        offset = self.section_offset(section)
+        header = self.header
+        data = None
+        if header['{}_size'.format(section)] != 0:
+            position = self.fileh.tell()
+            self.fileh.seek(offset)
+            try:
+                if section in ('box', 'vir', 'pres'):
+                    data = read_matrix(self.fileh, header['endian'],
+                                       header['double'])
+                else:
+                    data = read_coord(self.fileh, header['endian'],
+                                      header['double'], header['natoms'])
+            finally:
+                # Restore the position, also if the read failed, so
+                # that the reader continues from the next frame:
+                self.fileh.seek(position)
+        self._cache[section] = data
+        return data
+
+    def get_data(self):
+        """Read all sections present in the frame.
+
+        Returns
+        -------
+        data : dict
+            The data for the frame, as returned by
+            :py:func:`.read_trr_data`.
+        """
+        data = {}
+        for key in header_sections(self.header):
+            data[key] = self.get_section(key)
+        return data
+
+    @property
+    def box(self):
+        """The box matrix."""
+        return self.get_section('box')
+
+    @property
+    def vir(self):
+        """The virial matrix."""
+        return self.get_section('vir')
+
+    @property
+    def pres(self):
+        """The pressure matrix."""
+        return self.get_section('pres')
+
+    @property
+    def x(self):
+        """The coordinates."""
+        return self.get_section('x')
+
+    @property
+    def v(self):
+        """The velocities."""
+        return self.get_section('v')
+
+    @property
+    def f(self):
+        """The forces."""
+        return self.get_section('f')
+
+
 class GroTrrReader():
     """A simple class for reading frames from a GROMACS TRR file.
 
     Attributes
     ----------
-    filename : string
-        The file name to open
+    filename : string, file object, callable or storage
+        The file to open. Besides file names, anything accepted by
+        :py:func:`.open_storage` can be used, e.g. a callable for
+        reading byte ranges from a remote storage.
     _skip : boolean
         If True, the next frame will be skipped. This is used
         to control the reading when iterating so that we do not
@@ -408,30 +911,62 @@ class GroTrrReader():
         The open file handle.
     header : dict
         The previously read header from the TRR file.
+    access : string
+        The expected access pattern, given as a hint to the operating
+        system (see :py:mod:`pytrr.iohints`).
+    buffering : integer
+        The buffer size used when opening the file.
+    _releaser : object like :py:class:`.CacheReleaser`
+        Used for dropping consumed data from the page cache, for
+        the ``'once'`` access pattern.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, access=None, buffering=-1):
         """Initiate the reader.
 
         Parameters
         ----------
-        filename : string
-            The name of the file to open.
+        filename : string, file object, callable or storage
+            The file to open.
+        access : string, optional
+            The expected access pattern, one of ``'normal'``,
+            ``'sequential'``, ``'random'`` or ``'once'``. With
+            ``'once'``, the data read is dropped from the page cache.
+        buffering : integer, optional
+            The buffer size (in bytes) to use for reading. The default
+            is the default buffer size for :py:func:`open`.
         """
+        if access is not None:
+            check_access(access)
         self.filename = filename
         self._skip = False
         self.fileh = None
         self.header = None
+        self.access = access
+        self.buffering = buffering
+        self._releaser = None
 
     def __enter__(self):
         """Just open the file."""
-        self.fileh = open(self.filename, 'rb')
+        self.fileh = open_file(self.filename, buffering=self.buffering)
+        if self.access is not None and is_path(self.filename):
+            advise_file(self.fileh, self.access)
+            if self.access == 'once':
+                self._releaser = CacheReleaser(self.fileh)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         """Ensure that we close the file."""
+        if self._releaser is not None:
+            self._releaser.consumed(self.fileh.tell(), force=True)
+            self._releaser = None
         self.fileh.close()
 
+    def _consumed(self):
+        """Mark the file as consumed up to the current position."""
+        if self._releaser is not None:
+            self._releaser.consumed(self.fileh.tell())
+
     def read_frame(self, read_data=True):
         """Read a new frame from the file.
 
@@ -454,6 +989,7 @@ class GroTrrReader():
         else:
             skip_trr_data(self.fileh, header)
             data = {}
+        self._consumed()
         return header, data
 
     def __iter__(self):
@@ -472,6 +1008,7 @@ class GroTrrReader():
         try:
             if self._skip:
                 self.skip_data()
+            self._consumed()
             header = read_trr_header(self.fileh)
             self._skip = True
             self.header = header
@@ -488,3 +1025,28 @@ class GroTrrReader():
         """Just skip data."""
         self._skip = False
         skip_trr_data(self.fileh, self.header)
+
+    def frames(self):
+        """Iterate over the frames, without reading the data.
+
+        The frames are returned as :py:class:`.TrrFrame` objects which
+        read the data sections when they are accessed. A frame which
+        is not accessed only costs reading the header.
+
+        Yields
+        ------
+        out : object like :py:class:`.TrrFrame`
+            The frames in the file.
+        """
+        while True:
+            try:
+                if self._skip:
+                    self.skip_data()
+                self._consumed()
+                header = read_trr_header(self.fileh)
+            except EOFError:
+                return
+            self.header = header
+            frame = TrrFrame(self.fileh, header, self.fileh.tell())
+            skip_trr_data(self.fileh, header)
+            yield frame
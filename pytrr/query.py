@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for selecting frames in TRR files from their metadata.
+
+The per-frame metadata (the header fields and the box matrices stored
+in the index) are collected in a columnar table. Frames are selected
+by evaluating vectorized predicates on the columns, and the heavy
+data sections are only read for the frames that match.
+
+Useful classes defined here
+---------------------------
+
+FrameTable
+    A columnar table with the metadata for each frame.
+
+Example
+-------
+
+>>> table = FrameTable.from_file('traj.trr')
+>>> frames = table.select(
+>>>     lambda t: t['volume'] > 27.0,
+>>>     time=(10.0, 20.0),
+>>>     has_v=True,
+>>> )
+>>> data = table.read('traj.trr', frames, sections=('x', 'v'))
+"""
+import numpy as np
+from .index import TrrIndex, read_frames
+from .pytrr import SECTIONS
+
+
+class FrameTable():
+    """A columnar table with the metadata for the frames in a TRR file.
+
+    The columns are the header fields (e.g. ``'step'``, ``'time'``,
+    ``'lambda'`` and ``'natoms'``), flags for the sections present
+    (e.g. ``'has_x'``), the box matrices (``'box'``) and the box
+    volumes (``'volume'``).
+
+    Attributes
+    ----------
+    index : object like :py:class:`.TrrIndex`
+        The index the table is created from.
+    columns : dict of objects like :py:class:`numpy.ndarray`
+        The columns of the table.
+    """
+
+    def __init__(self, index):
+        """Create the table from an index.
+
+        Parameters
+        ----------
+        index : object like :py:class:`.TrrIndex`
+            The index for the file. It should contain the boxes.
+        """
+        self.index = index
+        headers = index.headers
+        self.columns = {}
+        for key in headers.data.dtype.names:
+            self.columns[key] = headers[key]
+        for section in SECTIONS:
+            self.columns['has_{}'.format(section)] = (
+                headers['{}_size'.format(section)] != 0
+            )
+        if index.boxes is not None:
+            self.columns['box'] = index.boxes
+            self.columns['volume'] = np.abs(np.linalg.det(index.boxes))
+
+    @classmethod
+    def from_file(cls, filename):
+        """Create the table by indexing a file.
+
+        The box matrices are read when indexing, so that the table
+        contains the ``box`` and ``volume`` columns.
+
+        Parameters
+        ----------
+        filename : string, file object, callable or storage
+            The TRR file.
+
+        Returns
+        -------
+        out : object like :py:class:`.FrameTable`
+            The table for the file.
+        """
+        return cls(TrrIndex.from_file(filename, read_boxes=True))
+
+    def __len__(self):
+        """Return the number of frames."""
+        return len(self.index)
+
+    def __getitem__(self, key):
+        """Return a column."""
+        return self.columns[key]
+
+    def __contains__(self, key):
+        """Check if we have a column."""
+        return key in self.columns
+
+    def mask(self, predicate=None, **conditions):
+        """Evaluate a selection as a boolean mask.
+
+        Parameters
+        ----------
+        predicate : callable or object like :py:class:`numpy.ndarray`
+            A callable, ``predicate(table)``, returning a boolean
+            array with one value per frame, or such an array.
+        conditions : dict, optional
+            Conditions on columns, given as ``column=value`` for
+            equality or as ``column=(low, high)`` for an inclusive
+            range. None can be used for an open end of a range.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            True for the frames matching all the conditions.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if predicate is not None:
+            if callable(predicate):
+                predicate = predicate(self)
+            mask &= np.asarray(predicate, dtype=bool)
+        for key, value in conditions.items():
+            column = self[key]
+            if isinstance(value, tuple):
+                low, high = value
+                if low is not None:
+                    mask &= column >= low
+                if high is not None:
+                    mask &= column <= high
+            else:
+                mask &= column == value
+        return mask
+
+    def select(self, predicate=None, **conditions):
+        """Return the frames matching a selection.
+
+        Parameters
+        ----------
+        predicate : callable or object like :py:class:`numpy.ndarray`
+            See :py:meth:`.mask`.
+        conditions : dict, optional
+            See :py:meth:`.mask`.
+
+        Returns
+        -------
+        out : object like :py:class:`numpy.ndarray`
+            The indices of the matching frames.
+        """
+        return np.flatnonzero(self.mask(predicate, **conditions))
+
+    def read(self, source, frames, sections=None):
+        """Read the data for selected frames.
+
+        Parameters
+        ----------
+        source : string, file object, callable or storage
+            The TRR file to read from.
+        frames : iterable of ints
+            The frames to read, e.g. from :py:meth:`.select`.
+        sections : iterable of strings, optional
+            The sections to read. If not given, all sections present
+            are read.
+
+        Returns
+        -------
+        out : list of dicts
+            The data for each frame.
+        """
+        return read_frames(source, self.index, frames=frames,
+                           sections=sections)
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for reading TRR files from the end, without an index.
+
+The frames are located from the end of the file and backwards:
+
+1. The size of the previous frame found (initially the first frame in
+   the file) is used to guess where the next frame starts. For files
+   where all frames have the same layout, this finds every frame
+   with a single header read.
+
+2. If the guess fails, the file is scanned backwards in blocks for
+   the start of a header (the magic number followed by the version
+   string ``GMX_trn_file``).
+
+A candidate is only accepted if the frame it starts ends exactly
+where the frame after it starts. For the last frame, an incomplete
+frame at the end of the file (e.g. from a simulation which is still
+running) is skipped.
+
+Useful methods defined here
+---------------------------
+
+read_last_frame
+    Read the last complete frame in a file.
+
+reverse_frames
+    Iterate over the frames in a file, from the last to the first.
+
+Example
+-------
+
+>>> header, data = read_last_frame('traj.trr')
+>>> for header, data in reverse_frames('traj.trr'):
+>>>     print(header['step'])
+"""
+import io
+import struct
+from .pytrr import (
+    get_struct,
+    read_trr_data,
+    read_trr_header,
+    DATA_ITEMS,
+    GROMACS_MAGIC,
+    TRR_VERSION_B,
+)
+from .storage import open_file
+
+
+# The number of bytes to read at a time when scanning for headers:
+SCAN_BLOCK = 1024**2
+
+
+def _header_pattern(endian):
+    """Return the bytes starting a header in the given byte order."""
+    slen = len(TRR_VERSION_B) + 1
+    return get_struct('{}3i'.format(endian)).pack(
+        GROMACS_MAGIC, slen, slen - 1
+    ) + TRR_VERSION_B
+
+
+def _read_candidate(fileh, offset):
+    """Try to read a header at an offset.
+
+    Parameters
+    ----------
+    fileh : file object
+        The file to read from.
+    offset : integer
+        The position to read the header from.
+
+    Returns
+    -------
+    out : tuple or None
+        The header, the offset of the data and the size of the frame,
+        or None if no valid header was found.
+    """
+    fileh.seek(offset, io.SEEK_SET)
+    try:
+        header = read_trr_header(fileh)
+    except (EOFError, ValueError, ZeroDivisionError, struct.error):
+        return None
+    sizes = [header[key] for key in DATA_ITEMS]
+    if min(sizes) < 0 or header['natoms'] < 0:
+        return None
+    data_offset = fileh.tell()
+    return header, data_offset, data_offset - offset + sum(sizes)
+
+
+class _ReverseScanner():
+    """Locate the frames of a TRR file from the end.
+
+    Attributes
+    ----------
+    fileh : file object
+        The file to read from.
+    size : integer
+        The size of the file.
+    first : object like :py:class:`.TrrHeader`
+        The header of the first frame.
+    stride : integer
+        The size of the first frame.
+    pattern : bytes
+        The bytes starting a header.
+    """
+
+    def __init__(self, fileh):
+        """Read the first header and the size of the file."""
+        self.fileh = fileh
+        self.size = fileh.seek(0, io.SEEK_END)
+        fileh.seek(0, io.SEEK_SET)
+        self.first = read_trr_header(fileh)
+        self.stride = fileh.tell() + sum(self.first[key]
+                                         for key in DATA_ITEMS)
+        self.pattern = _header_pattern(self.first['endian'])
+
+    def _is_complete(self, offset):
+        """Check if a complete frame starts at an offset."""
+        if offset >= self.size:
+            return False
+        candidate = _read_candidate(self.fileh, offset)
+        return candidate is not None and offset + candidate[2] <= self.size
+
+    def _accept(self, offset, end):
+        """Check if a frame starts at an offset and ends at ``end``.
+
+        ``end`` is None when looking for the last complete frame.
+        """
+        candidate = _read_candidate(self.fileh, offset)
+        if candidate is None:
+            return None
+        # The byte order is given by the pattern, but the precision
+        # may change between frames:
+        header, _, frame_size = candidate
+        if header['endian'] != self.first['endian']:
+            return None
+        stop = offset + frame_size
+        if end is None:
+            if stop > self.size or self._is_complete(stop):
+                return None
+        elif stop != end:
+            return None
+        return (offset,) + candidate
+
+    def _scan(self, end):
+        """Scan backwards for the frame ending at ``end``."""
+        position = self.size if end is None else end
+        overlap = len(self.pattern) - 1
+        while position > 0:
+            start = max(0, position - SCAN_BLOCK)
+            self.fileh.seek(start, io.SEEK_SET)
+            block = self.fileh.read(
+                min(position + overlap, self.size) - start
+            )
+            high = len(block)
+            while True:
+                i = block.rfind(self.pattern, 0, high)
+                if i < 0:
+                    break
+                high = i + overlap
+                if start + i >= position:
+                    continue
+                found = self._accept(start + i, end)
+                if found is not None:
+                    return found
+            position = start
+        return None
+
+    def frames(self):
+        """Yield the frames, from the last to the first.
+
+        Yields
+        ------
+        out : tuple
+            The offset of the frame, its header, the offset of its
+            data and its size.
+        """
+        end = None
+        stride = self.stride
+        while end is None or end > 0:
+            if end is None:
+                guess = (self.size // stride - 1) * stride
+            else:
+                guess = end - stride
+            found = None
+            if guess >= 0:
+                found = self._accept(guess, end)
+            if found is None:
+                found = self._scan(end)
+            if found is None:
+                if end is None:
+                    return
+                raise ValueError('No frame ends at offset {}'.format(end))
+            yield found
+            end, stride = found[0], found[3]
+
+
+def reverse_frames(filename, read_data=True):
+    """Iterate over the frames in a TRR file, from the last to the first.
+
+    No index is needed, and for files where all frames have the same
+    layout only the headers of the frames returned are read.
+
+    Parameters
+    ----------
+    filename : string, file object, callable or storage
+        The TRR file to read, see :py:func:`.open_storage`. The size
+        of the file must be known, so callables should be given as
+        ``open_storage(source, size=...)``.
+    read_data : boolean, optional
+        If False, only the headers are read.
+
+    Yields
+    ------
+    out[0] : object like :py:class:`.TrrHeader`
+        The header of the frame.
+    out[1] : dict
+        The data of the frame, as returned by :py:func:`.read_trr_data`,
+        or an empty dict if ``read_data`` is False.
+    """
+    with open_file(filename) as fileh:
+        try:
+            scanner = _ReverseScanner(fileh)
+        except (EOFError, struct.error):
+            # The file is empty or ends inside the first header.
+            return
+        for _, header, data_offset, _ in scanner.frames():
+            data = {}
+            if read_data:
+                fileh.seek(data_offset, io.SEEK_SET)
+                data = read_trr_data(fileh, header)
+            yield header, data
+
+
+def read_last_frame(filename, read_data=True):
+    """Read the last complete frame in a TRR file.
+
+    Parameters
+    ----------
+    filename : string, file object, callable or storage
+        The TRR file to read, see :py:func:`.open_storage`. The size
+        of the file must be known, so callables should be given as
+        ``open_storage(source, size=...)``.
+    read_data : boolean, optional
+        If False, only the header is read.
+
+    Returns
+    -------
+    out[0] : object like :py:class:`.TrrHeader`
+        The header of the frame.
+    out[1] : dict
+        The data of the frame, as returned by :py:func:`.read_trr_data`.
+
+    Raises
+    ------
+    EOFError
+        If the file does not contain a complete frame.
+    ValueError
+        If the size of the file is not known.
+    """
+    frames = reverse_frames(filename, read_data=read_data)
+    try:
+        return next(frames)
+    except StopIteration:
+        raise EOFError('No complete frames in the file')
+    finally:
+        frames.close()
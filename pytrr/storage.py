@@ -0,0 +1,704 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module defining storage backends for reading TRR files.
+
+A storage is anything we can read byte ranges from, e.g. a local
+file, an open file object or a callable fetching ranges from a remote
+object store. Reads can be coalesced, so that ranges close to each
+other are fetched in one request, and a block cache can be used so
+that many small reads (e.g. when reading headers) result in a few
+large requests.
+
+Useful methods defined here
+---------------------------
+
+coalesce_ranges
+    Merge byte ranges which are adjacent or close to each other.
+
+open_storage
+    Create a (cached) storage for a file name, file object or
+    callable.
+
+open_file
+    Open a file name, file object, callable or storage as a file
+    object.
+
+Useful classes defined here
+---------------------------
+
+FileStorage
+    A storage reading from a local file or a file object.
+
+CallableStorage
+    A storage reading with a callable, ``read(offset, size)``.
+
+CachedStorage
+    A storage adding a block-level LRU cache to another storage.
+
+StorageFile
+    A read-only file object for reading from a storage.
+
+Example
+-------
+
+>>> def fetch(offset, size):
+>>>     return remote.get_range('traj.trr', offset, size)
+>>> storage = open_storage(fetch, size=remote.size('traj.trr'))
+>>> with GroTrrReader(storage) as trrfile:
+>>>     for header in trrfile:
+>>>         print(header['step'])
+"""
+import bisect
+from collections import OrderedDict
+import io
+import os
+import threading
+
+
+BLOCK_SIZE = 1024**2
+MAX_BLOCKS = 64
+MAX_GAP = 64 * 1024
+# Path-like objects (os.PathLike is not available before Python 3.6):
+_PATH_TYPES = (os.PathLike,) if hasattr(os, 'PathLike') else ()
+
+
+def coalesce_ranges(ranges, max_gap=0):
+    """Merge byte ranges which are adjacent or close to each other.
+
+    Parameters
+    ----------
+    ranges : list of tuples of ints
+        The ranges as ``(offset, size)``.
+    max_gap : integer, optional
+        Ranges separated by at most this number of bytes are merged.
+
+    Returns
+    -------
+    merged : list of tuples
+        The merged ranges, as ``(start, stop, members)`` where
+        ``members`` are the positions (in ``ranges``) of the
+        ranges covered by the merged range.
+    """
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    merged = []
+    for i in order:
+        start, size = ranges[i]
+        stop = start + size
+        if merged and start <= merged[-1][1] + max_gap:
+            merged[-1][1] = max(merged[-1][1], stop)
+            merged[-1][2].append(i)
+        else:
+            merged.append([start, stop, [i]])
+    return [tuple(i) for i in merged]
+
+
+class RangeStorage():
+    """A base class for storages we can read byte ranges from.
+
+    Attributes
+    ----------
+    max_gap : integer
+        Ranges separated by at most this number of bytes are fetched
+        in one request by :py:meth:`.read_ranges`.
+    requests : integer
+        The number of requests made to the underlying storage.
+    batched : boolean
+        True if :py:meth:`.read_ranges` reads ranges which are far
+        apart about as cheaply as a single range.
+    """
+
+    batched = False
+
+    def __init__(self, max_gap=MAX_GAP):
+        """Set up the storage.
+
+        Parameters
+        ----------
+        max_gap : integer, optional
+            The largest gap between ranges that we will coalesce.
+        """
+        self.max_gap = max_gap
+        self.requests = 0
+
+    def size(self):
+        """Return the size of the storage, or None if unknown."""
+        return None
+
+    def read_range(self, offset, size):
+        """Read a range of bytes.
+
+        Parameters
+        ----------
+        offset : integer
+            The start of the range.
+        size : integer
+            The number of bytes to read.
+
+        Returns
+        -------
+        out : bytes
+            The bytes read. This may be shorter than ``size`` if
+            the range extends past the end of the storage.
+        """
+        raise NotImplementedError
+
+    def read_ranges(self, ranges):
+        """Read several byte ranges, coalescing them.
+
+        Parameters
+        ----------
+        ranges : list of tuples of ints
+            The ranges to read, as ``(offset, size)``.
+
+        Returns
+        -------
+        out : list of bytes
+            The bytes read for each range.
+        """
+        out = [None] * len(ranges)
+        for start, stop, members in coalesce_ranges(ranges, self.max_gap):
+            buff = memoryview(self.read_range(start, stop - start))
+            for i in members:
+                offset, size = ranges[i]
+                out[i] = bytes(buff[offset - start:offset - start + size])
+        return out
+
+    def close(self):
+        """Release resources held by the storage."""
+
+
+class FileStorage(RangeStorage):
+    """A storage reading from a local file or a file object.
+
+    For file names, the reading is done with :py:func:`os.pread` when
+    this is available. Otherwise, a lock is used to make reading with
+    seek and read thread-safe.
+
+    Attributes
+    ----------
+    fileh : file object or None
+        The file object we read from (if we were not given a name).
+    fileno : integer or None
+        The file descriptor we read from (if we were given a name).
+    """
+
+    # Local reads are cheap, so reading many small ranges is fine:
+    batched = True
+
+    def __init__(self, source, max_gap=MAX_GAP):
+        """Open the file.
+
+        Parameters
+        ----------
+        source : string or file object
+            The file to read from.
+        max_gap : integer, optional
+            The largest gap between ranges that we will coalesce.
+        """
+        super().__init__(max_gap=max_gap)
+        self._lock = threading.Lock()
+        self.fileh = None
+        self.fileno = None
+        if is_path(source):
+            self.fileno = os.open(source, os.O_RDONLY)
+        else:
+            self.fileh = source
+
+    def size(self):
+        """Return the size of the file."""
+        if self.fileno is not None:
+            return os.fstat(self.fileno).st_size
+        with self._lock:
+            position = self.fileh.tell()
+            size = self.fileh.seek(0, io.SEEK_END)
+            self.fileh.seek(position)
+        return size
+
+    def read_range(self, offset, size):
+        """Read a range of bytes from the file."""
+        self.requests += 1
+        if self.fileno is not None and hasattr(os, 'pread'):
+            return os.pread(self.fileno, size, offset)
+        with self._lock:
+            if self.fileno is not None:
+                os.lseek(self.fileno, offset, os.SEEK_SET)
+                return os.read(self.fileno, size)
+            self.fileh.seek(offset)
+            return self.fileh.read(size)
+
+    def close(self):
+        """Close the file, if we opened it."""
+        if self.fileno is not None:
+            os.close(self.fileno)
+            self.fileno = None
+
+
+class CallableStorage(RangeStorage):
+    """A storage reading byte ranges with a callable.
+
+    Attributes
+    ----------
+    reader : callable
+        The callable, ``reader(offset, size)``, returning bytes.
+    batch_reader : callable or None
+        A callable, ``batch_reader(ranges)``, reading a list of
+        ``(offset, size)`` ranges in one request and returning a list
+        of bytes, e.g. using a multi-range request.
+    """
+
+    def __init__(self, reader, size=None, max_gap=MAX_GAP,
+                 batch_reader=None):
+        """Set up the storage.
+
+        Parameters
+        ----------
+        reader : callable
+            The callable, ``reader(offset, size)``, returning bytes.
+        size : integer, optional
+            The total size of the storage, if known.
+        max_gap : integer, optional
+            The largest gap between ranges that we will coalesce.
+        batch_reader : callable, optional
+            A callable, ``batch_reader(ranges)``, for reading several
+            ranges in one request.
+        """
+        super().__init__(max_gap=max_gap)
+        self.reader = reader
+        self.batch_reader = batch_reader
+        self._size = size
+
+    @property
+    def batched(self):
+        """True if we can read several ranges in one request."""
+        return self.batch_reader is not None
+
+    def size(self):
+        """Return the size of the storage, if known."""
+        return self._size
+
+    def read_range(self, offset, size):
+        """Read a range of bytes with the callable."""
+        self.requests += 1
+        return self.reader(offset, size)
+
+    def read_ranges(self, ranges):
+        """Read several byte ranges, in one request if possible."""
+        if self.batch_reader is None or len(ranges) < 2:
+            return super().read_ranges(ranges)
+        merged = coalesce_ranges(ranges, self.max_gap)
+        self.requests += 1
+        buffers = self.batch_reader([(start, stop - start)
+                                     for start, stop, _ in merged])
+        out = [None] * len(ranges)
+        for (start, _, members), buff in zip(merged, buffers):
+            buff = memoryview(buff)
+            for i in members:
+                offset, size = ranges[i]
+                out[i] = bytes(buff[offset - start:offset - start + size])
+        return out
+
+
+class CachedStorage(RangeStorage):
+    """A block-level LRU cache on top of another storage.
+
+    Reads are done in whole blocks, and consecutive missing blocks are
+    fetched in one request to the underlying storage. Ranges which are
+    prefetched (e.g. the headers of the following frames) are kept
+    apart from the blocks, so that prefetching does not evict the
+    blocks in use.
+
+    Attributes
+    ----------
+    storage : object like :py:class:`.RangeStorage`
+        The storage we are caching.
+    block_size : integer
+        The size of the blocks.
+    max_blocks : integer
+        The maximum number of blocks to keep in the cache.
+    hits : integer
+        The number of block lookups found in the cache.
+    misses : integer
+        The number of block lookups not found in the cache.
+    prefetch_bytes : integer
+        The maximum number of prefetched bytes to keep. This is half
+        the capacity of the block cache.
+    """
+
+    def __init__(self, storage, block_size=BLOCK_SIZE, max_blocks=MAX_BLOCKS):
+        """Set up the cache.
+
+        Parameters
+        ----------
+        storage : object like :py:class:`.RangeStorage`
+            The storage to cache.
+        block_size : integer, optional
+            The size of the blocks.
+        max_blocks : integer, optional
+            The maximum number of blocks to keep in the cache.
+        """
+        self.max_gap = storage.max_gap
+        self.storage = storage
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_bytes = block_size * max_blocks // 2
+        self._blocks = OrderedDict()
+        self._ranges = OrderedDict()
+        self._range_starts = []
+        self._range_bytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def requests(self):
+        """The number of requests made to the underlying storage."""
+        return self.storage.requests
+
+    def size(self):
+        """Return the size of the underlying storage."""
+        return self.storage.size()
+
+    def _blocks_for(self, offset, size):
+        """Return the blocks covering a byte range."""
+        if size <= 0:
+            return range(0)
+        return range(offset // self.block_size,
+                     (offset + size - 1) // self.block_size + 1)
+
+    def _load(self, blocks):
+        """Make sure the given blocks are in the cache.
+
+        Parameters
+        ----------
+        blocks : iterable of ints
+            The blocks to load.
+        """
+        missing = []
+        for block in sorted(set(blocks)):
+            if block in self._blocks:
+                self._blocks.move_to_end(block)
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.append(block)
+        if not missing:
+            return
+        ranges = [(block * self.block_size, self.block_size)
+                  for block in missing]
+        total = self.storage.size()
+        if total is not None:
+            ranges = [(start, max(0, min(size, total - start)))
+                      for start, size in ranges]
+        # Consecutive blocks have no gap, so they are always merged:
+        for block, buff in zip(missing, self.storage.read_ranges(ranges)):
+            self._blocks[block] = buff
+            self._blocks.move_to_end(block)
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+    def _prefetched(self, offset, size):
+        """Return a range from the prefetched ranges, or None."""
+        i = bisect.bisect_right(self._range_starts, offset) - 1
+        if i < 0:
+            return None
+        start = self._range_starts[i]
+        buff = self._ranges[start]
+        if offset + size > start + len(buff):
+            return None
+        return buff[offset - start:offset - start + size]
+
+    def _store_range(self, offset, buff):
+        """Keep a prefetched range, evicting the oldest ones."""
+        if offset in self._ranges or len(buff) > self.prefetch_bytes:
+            return
+        self._ranges[offset] = buff
+        bisect.insort(self._range_starts, offset)
+        self._range_bytes += len(buff)
+        while self._range_bytes > self.prefetch_bytes:
+            start, old = self._ranges.popitem(last=False)
+            self._range_starts.remove(start)
+            self._range_bytes -= len(old)
+
+    def _select_prefetch(self, ranges):
+        """Select the ranges to prefetch and read them.
+
+        If the underlying storage can read many ranges in one request,
+        the ranges themselves are read, up to ``prefetch_bytes``.
+        Otherwise, the ranges are read with a single request spanning
+        them, as long as this reads no more bytes than reading their
+        blocks would, and nothing is prefetched if this only covers
+        one range.
+        """
+        picked = []
+        if self.storage.batched:
+            nbytes = 0
+            for offset, size in ranges:
+                if nbytes + size > self.prefetch_bytes:
+                    break
+                picked.append((offset, size))
+                nbytes += size
+            return picked, self.storage.read_ranges(picked)
+        start = ranges[0][0]
+        for offset, size in ranges:
+            limit = min(self.prefetch_bytes,
+                        (len(picked) + 1) * self.block_size)
+            if offset + size - start > limit:
+                break
+            picked.append((offset, size))
+        if len(picked) < 2:
+            return [], []
+        span = memoryview(self.storage.read_range(
+            start, picked[-1][0] + picked[-1][1] - start
+        ))
+        return picked, [bytes(span[offset - start:offset - start + size])
+                        for offset, size in picked]
+
+    def prefetch(self, ranges):
+        """Fetch the given byte ranges and keep them.
+
+        The ranges are clamped to the size of the storage, and nothing
+        is prefetched if the size is unknown. At most
+        ``prefetch_bytes`` are kept, and ranges which are already
+        cached are skipped.
+
+        Parameters
+        ----------
+        ranges : list of tuples of ints
+            The ranges, as ``(offset, size)``.
+        """
+        total = self.storage.size()
+        if total is None:
+            return
+        with self._lock:
+            missing = []
+            for offset, size in sorted(ranges):
+                size = min(size, total - offset)
+                if size <= 0 or self._prefetched(offset, size) is not None:
+                    continue
+                missing.append((offset, size))
+            if not missing:
+                return
+            for (offset, _), buff in zip(*self._select_prefetch(missing)):
+                self._store_range(offset, buff)
+
+    def read_range(self, offset, size):
+        """Read a range of bytes, using the cache."""
+        with self._lock:
+            buff = self._prefetched(offset, size)
+        if buff is not None:
+            return buff
+        blocks = self._blocks_for(offset, size)
+        if len(blocks) > self.max_blocks:
+            # This will not fit in the cache, just read it directly:
+            return self.storage.read_range(offset, size)
+        with self._lock:
+            self._load(blocks)
+            parts = []
+            for block in blocks:
+                buff = self._blocks[block]
+                start = max(offset - block * self.block_size, 0)
+                stop = min(offset + size - block * self.block_size,
+                           self.block_size)
+                parts.append(buff[start:stop])
+                if len(buff) < self.block_size:
+                    break
+        return b''.join(parts)
+
+    def read_ranges(self, ranges):
+        """Read several byte ranges, fetching missing ones in one batch."""
+        out = [None] * len(ranges)
+        missing = []
+        with self._lock:
+            for i, (offset, size) in enumerate(ranges):
+                out[i] = self._prefetched(offset, size)
+                if out[i] is None:
+                    missing.append(i)
+        if missing:
+            buffers = self.storage.read_ranges([ranges[i] for i in missing])
+            for i, buff in zip(missing, buffers):
+                out[i] = buff
+        return out
+
+    def close(self):
+        """Empty the cache and close the underlying storage."""
+        self._blocks.clear()
+        self._ranges.clear()
+        self._range_starts = []
+        self._range_bytes = 0
+        self.storage.close()
+
+
+def is_path(source):
+    """Check if a source is a file name.
+
+    Parameters
+    ----------
+    source : object
+        The source to check.
+
+    Returns
+    -------
+    out : boolean
+        True if the source is a file name.
+    """
+    return isinstance(source, (str, bytes) + _PATH_TYPES)
+
+
+def open_file(source, buffering=-1):
+    """Open a source for reading as a file object.
+
+    Parameters
+    ----------
+    source : string, file object, callable or storage
+        What to read from, see :py:func:`.open_storage`.
+    buffering : integer, optional
+        The buffer size used when opening files by name.
+
+    Returns
+    -------
+    out : file object
+        The file object to read from.
+    """
+    if is_path(source):
+        return open(source, 'rb', buffering=buffering)
+    return StorageFile(open_storage(source),
+                       owner=not isinstance(source, RangeStorage))
+
+
+def open_storage(source, size=None, block_size=BLOCK_SIZE,
+                 max_blocks=MAX_BLOCKS, max_gap=MAX_GAP, batch_reader=None):
+    """Create a cached storage for reading.
+
+    Parameters
+    ----------
+    source : string, file object, callable or storage
+        What to read from. Callables should have the signature
+        ``source(offset, size)`` and return bytes. If a storage is
+        given, it is returned as-is.
+    size : integer, optional
+        The total size, used when ``source`` is a callable.
+    block_size : integer, optional
+        The block size for the cache.
+    max_blocks : integer, optional
+        The maximum number of blocks to cache.
+    max_gap : integer, optional
+        The largest gap between ranges that we will coalesce.
+    batch_reader : callable, optional
+        A callable, ``batch_reader(ranges)``, for reading several
+        ranges in one request when ``source`` is a callable, see
+        :py:class:`.CallableStorage`.
+
+    Returns
+    -------
+    out : object like :py:class:`.RangeStorage`
+        The storage created.
+    """
+    if isinstance(source, RangeStorage):
+        return source
+    if callable(source) and not hasattr(source, 'read'):
+        storage = CallableStorage(source, size=size, max_gap=max_gap,
+                                  batch_reader=batch_reader)
+    else:
+        storage = FileStorage(source, max_gap=max_gap)
+    return CachedStorage(storage, block_size=block_size,
+                         max_blocks=max_blocks)
+
+
+class StorageFile():
+    """A read-only file object for reading from a storage.
+
+    Attributes
+    ----------
+    storage : object like :py:class:`.RangeStorage`
+        The storage we read from.
+    position : integer
+        The current position in the storage.
+    closed : boolean
+        True if the file has been closed.
+    owner : boolean
+        If True, the storage is closed when the file is closed.
+    """
+
+    def __init__(self, storage, owner=True):
+        """Set up the file for the given storage.
+
+        Parameters
+        ----------
+        storage : object like :py:class:`.RangeStorage`
+            The storage to read from.
+        owner : boolean, optional
+            If True, the storage is closed when the file is closed.
+        """
+        self.storage = storage
+        self.owner = owner
+        self.position = 0
+        self.closed = False
+
+    def __enter__(self):
+        """Return the file for use in a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the file."""
+        self.close()
+
+    def _check_closed(self):
+        """Raise an error if the file is closed."""
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+    def readable(self):
+        """The file can be read."""
+        return True
+
+    def seekable(self):
+        """The file supports seek."""
+        return True
+
+    def read(self, size=-1):
+        """Read bytes from the current position."""
+        self._check_closed()
+        if size is None or size < 0:
+            total = self.storage.size()
+            if total is None:
+                raise ValueError('Size of the storage is unknown, give it '
+                                 'with open_storage(..., size=...).')
+            size = max(0, total - self.position)
+        buff = self.storage.read_range(self.position, size)
+        self.position += len(buff)
+        return buff
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Move to a new position."""
+        self._check_closed()
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            total = self.storage.size()
+            if total is None:
+                raise ValueError('Size of the storage is unknown, give it '
+                                 'with open_storage(..., size=...).')
+            self.position = total + offset
+        else:
+            raise ValueError('Invalid whence ({})'.format(whence))
+        return self.position
+
+    def tell(self):
+        """Return the current position."""
+        self._check_closed()
+        return self.position
+
+    def prefetch(self, ranges):
+        """Prefetch ranges, if the storage supports it."""
+        if hasattr(self.storage, 'prefetch'):
+            self.storage.prefetch(ranges)
+
+    def close(self):
+        """Close the file (and the storage if we own it)."""
+        if not self.closed:
+            if self.owner:
+                self.storage.close()
+            self.closed = True
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for extracting per-atom time series from TRR files.
+
+Analysis like velocity autocorrelation functions and per-atom mean
+squared displacements need arrays of shape ``(natoms, nframes, 3)``.
+The method defined here gathers only the selected atoms from each
+frame and transposes blocks of frames into a preallocated output,
+so that the memory used is bounded by the output and a block
+buffer, not by the length of the trajectory.
+
+Useful methods defined here
+---------------------------
+
+extract_timeseries
+    Extract time series for selected atoms from a TRR file.
+
+Example
+-------
+
+>>> series = extract_timeseries('traj.trr', atoms=[0, 5], fields=('v',))
+>>> print(series['v'].shape)
+"""
+import numpy as np
+from .index import TrrIndex
+from .iohints import advise_memmap, release_memmap
+
+
+BLOCK_BYTES = 64 * 1024**2
+
+
+def _frame_selection(frames, nframes):
+    """Convert a frame selection into an array of frame indices.
+
+    Parameters
+    ----------
+    frames : None, slice or iterable of ints
+        The frames to select. None will select all frames.
+    nframes : integer
+        The number of frames available.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.ndarray`
+        The selected frame indices.
+    """
+    if frames is None:
+        return np.arange(nframes)
+    if isinstance(frames, slice):
+        return np.arange(nframes)[frames]
+    frames = np.asarray(frames, dtype=np.int64).ravel()
+    if frames.size and (frames.min() < -nframes or frames.max() >= nframes):
+        raise IndexError('Frame selection is out of range')
+    return np.where(frames < 0, frames + nframes, frames)
+
+
+def _create_output(field, shape, out=None, outfile=None):
+    """Create the array we store the time series in.
+
+    Parameters
+    ----------
+    field : string
+        The field we create output for.
+    shape : tuple of ints
+        The shape of the output.
+    out : dict, optional
+        Preallocated output arrays, with the fields as keys.
+    outfile : string, optional
+        A file name pattern for memory mapped output. It is
+        formatted with the name of the field.
+
+    Returns
+    -------
+    out : object like :py:class:`numpy.ndarray`
+        The array we can store the time series in.
+    """
+    if out is not None and field in out:
+        if out[field].shape != shape:
+            raise ValueError(
+                'Output for "{}" has shape {}, expected {}'.format(
+                    field, out[field].shape, shape
+                )
+            )
+        return out[field]
+    if outfile is not None:
+        return np.lib.format.open_memmap(
+            outfile.format(field), mode='w+', dtype=np.float64, shape=shape
+        )
+    return np.empty(shape, dtype=np.float64)
+
+
+def extract_timeseries(filename, atoms=None, fields=('x',), frames=None,
+                       index=None, block_bytes=BLOCK_BYTES, out=None,
+                       outfile=None, transform=None, access=None):
+    """Extract per-atom time series from a TRR file.
+
+    The file is memory mapped and only the bytes of the selected
+    atoms are gathered from each frame. Frames are processed in
+    blocks, sized by ``block_bytes``, which are transposed into the
+    output array.
+
+    Parameters
+    ----------
+    filename : string
+        The TRR file to read from.
+    atoms : iterable of ints or slice, optional
+        The atoms to extract. If not given, all atoms are extracted.
+    fields : iterable of strings, optional
+        The sections to extract, e.g. ``('x', 'v')``.
+    frames : slice or iterable of ints, optional
+        The frames to extract. If not given, all frames are extracted.
+    index : object like :py:class:`.TrrIndex`, optional
+        A previously created index for the file. If not given, the
+        file will be indexed.
+    block_bytes : integer, optional
+        The approximate number of bytes to use for the block buffer.
+    out : dict, optional
+        Preallocated arrays to store the output in, with the fields
+        as keys. The arrays should have the shape
+        ``(natoms_selected, nframes_selected, 3)``.
+    outfile : string, optional
+        If given, output arrays not found in ``out`` are created as
+        memory mapped ``.npy`` files. The file name is obtained by
+        ``outfile.format(field)``, e.g. ``'series-{}.npy'``.
+    transform : callable, optional
+        A transformation applied to the positions (``'x'``) for each
+        block of frames, as ``transform(x, box)`` where ``x`` has shape
+        ``(nframes, natoms_selected, 3)`` and ``box`` has shape
+        ``(nframes, 3, 3)``. This can, for instance, be a
+        :py:class:`.Unwrapper` or :py:func:`.wrap_positions`.
+    access : string, optional
+        A hint about the access pattern for the memory mapped file,
+        see :py:mod:`pytrr.iohints`. With ``'once'``, each block of
+        frames is dropped from the page cache after it is consumed.
+
+    Returns
+    -------
+    series : dict
+        The extracted time series with the fields as keys. Each
+        array has the shape ``(natoms_selected, nframes_selected, 3)``.
+    """
+    if index is None:
+        index = TrrIndex.from_file(filename)
+    frame_idx = _frame_selection(frames, len(index))
+    nframes = len(frame_idx)
+    if nframes == 0:
+        raise ValueError('No frames were selected')
+    natoms = index.headers[frame_idx[0]]['natoms']
+    if atoms is None:
+        atom_idx = np.arange(natoms)
+    else:
+        atom_idx = np.arange(natoms)[atoms]
+    nsel = len(atom_idx)
+    if len(fields) > 1 and outfile is not None and '{' not in outfile:
+        raise ValueError('"outfile" must contain a field placeholder')
+
+    series = {}
+    for field in fields:
+        series[field] = _create_output(field, (nsel, nframes, 3),
+                                       out=out, outfile=outfile)
+
+    row_bytes = max(1, nsel * 3 * np.dtype(np.float64).itemsize)
+    block = max(1, min(nframes, block_bytes // row_bytes))
+    buff = np.empty((block, nsel, 3), dtype=np.float64)
+    boxes = np.empty((block, 3, 3), dtype=np.float64)
+    raw = np.memmap(filename, dtype=np.uint8, mode='r')
+    if access is not None:
+        advise_memmap(raw, access)
+    for k, field in enumerate(fields):
+        use_transform = transform is not None and field == 'x'
+        # With "once", the frames are released after the last field:
+        release = access == 'once' and k == len(fields) - 1
+        for start in range(0, nframes, block):
+            stop = min(start + block, nframes)
+            for j, i in enumerate(frame_idx[start:stop]):
+                header = index.headers[i]
+                if header['natoms'] != natoms:
+                    raise ValueError(
+                        'Number of atoms changes in frame {}'.format(i)
+                    )
+                buff[j] = index.section_view(raw, i, field)[atom_idx]
+                if use_transform:
+                    boxes[j] = index.section_view(raw, i, 'box')
+            if use_transform:
+                buff[:stop - start] = transform(buff[:stop - start],
+                                                boxes[:stop - start])
+            series[field][:, start:stop, :] = (
+                buff[:stop - start].transpose(1, 0, 2)
+            )
+            if release:
+                selected = frame_idx[start:stop]
+                first = int(index.offsets[selected.min()])
+                last = index.frame_end(selected.max())
+                release_memmap(raw, filename, first, last - first)
+    return series
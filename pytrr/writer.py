@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A module for writing TRR files from several processes.
+
+When all frames have the same layout (byte order, precision, number
+of atoms and sections), the byte offset of every frame is known in
+advance. The writer defined here preallocates the output file and
+writes frames at their offsets with :py:func:`os.pwrite`, so that
+frames can be written in any order and from several processes. The
+result is identical to writing the frames in order with
+:py:func:`.write_trr_frame`.
+
+Useful classes defined here
+---------------------------
+
+PresizedTrrWriter
+    A class for writing frames at precomputed offsets.
+
+Example
+-------
+
+Each process opens its own file descriptor, which should be closed
+when the process is done writing:
+
+>>> def write_frame(writer, frame, data):
+>>>     writer.write_frame(frame, data)
+>>>     writer.close()
+>>>
+>>> writer = PresizedTrrWriter('out.trr', 1000, natoms=100)
+>>> writer.create()
+>>> with ProcessPoolExecutor() as pool:
+>>>     # Consume the results, so that errors in the workers are raised:
+>>>     list(pool.map(write_frame, [writer] * 1000, range(1000), all_data))
+"""
+import os
+import threading
+import numpy as np
+from .index import section_shape
+from .pytrr import _encode_frame, _make_header, get_codec
+
+
+class PresizedTrrWriter():
+    """Write frames with a fixed layout at precomputed offsets.
+
+    The writer can be pickled and sent to other processes. Each
+    process opens its own file descriptor on first use.
+
+    Attributes
+    ----------
+    filename : string
+        The file we write to.
+    nframes : integer
+        The number of frames in the file.
+    natoms : integer
+        The number of atoms in each frame.
+    coords : tuple of strings
+        The coordinate sections in each frame, e.g. ``('x', 'v')``.
+    endian : string
+        The byte order. None means the native byte order.
+    double : boolean
+        True if we write in double precision.
+    codec : object like :py:class:`.TrrCodec`
+        The codec for the frame layout.
+    """
+
+    def __init__(self, filename, nframes, natoms, coords=('x', 'v'),
+                 endian=None, double=False):
+        """Set up the writer.
+
+        Parameters
+        ----------
+        filename : string
+            The file to write to.
+        nframes : integer
+            The number of frames in the file.
+        natoms : integer
+            The number of atoms in each frame.
+        coords : tuple of strings, optional
+            The coordinate sections to write in each frame. As for
+            :py:func:`.write_trr_frame`, the box is always written.
+        endian : string, optional
+            The byte order. If not given, the native one is used.
+        double : boolean, optional
+            If True, we will write in double precision.
+        """
+        self.filename = filename
+        self.nframes = nframes
+        self.natoms = natoms
+        self.coords = tuple(i for i in ('x', 'v', 'f') if i in coords)
+        if len(self.coords) != len(coords):
+            raise ValueError('Unknown coordinate sections: {}'.format(coords))
+        self.endian = endian
+        self.double = double
+        self.codec = get_codec(endian or '=', double, natoms,
+                               ('box',) + self.coords)
+        self._fileno = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Drop the file descriptor and lock when pickling."""
+        state = self.__dict__.copy()
+        state['_fileno'] = None
+        state['_pid'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restore the writer after unpickling."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """The size (in bytes) of the complete file."""
+        return self.nframes * self.codec.frame_size
+
+    def frame_offset(self, frame):
+        """Return the byte offset for a frame.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+
+        Returns
+        -------
+        out : integer
+            The offset of the frame in the file.
+        """
+        if not 0 <= frame < self.nframes:
+            raise IndexError('Frame {} is out of range'.format(frame))
+        return frame * self.codec.frame_size
+
+    def create(self):
+        """Create the file and allocate space for all frames."""
+        fileno = os.open(self.filename,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            if self.size > 0 and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fileno, 0, self.size)
+                except OSError:
+                    os.ftruncate(fileno, self.size)
+            else:
+                os.ftruncate(fileno, self.size)
+        finally:
+            os.close(fileno)
+
+    def _get_fileno(self):
+        """Return a file descriptor for this process."""
+        if self._fileno is None or self._pid != os.getpid():
+            self._fileno = os.open(self.filename, os.O_WRONLY)
+            self._pid = os.getpid()
+        return self._fileno
+
+    def encode(self, data):
+        """Encode a frame, checking that it matches the layout.
+
+        Parameters
+        ----------
+        data : dict
+            The data for the frame, as for :py:func:`.write_trr_frame`.
+
+        Returns
+        -------
+        out : bytes
+            The encoded frame.
+
+        Raises
+        ------
+        ValueError
+            If the number of atoms, the sections or the shape of a
+            section does not match the layout.
+        """
+        if data['natoms'] != self.natoms:
+            raise ValueError(
+                'Expected {} atoms, got {}'.format(self.natoms,
+                                                   data['natoms'])
+            )
+        coords = tuple(i for i in ('x', 'v', 'f') if i in data)
+        if coords != self.coords:
+            raise ValueError(
+                'Expected sections {}, got {}'.format(self.coords, coords)
+            )
+        header = _make_header(data, endian=self.endian, double=self.double)
+        for section in self.codec.sections:
+            shape = np.shape(data[section])
+            expected = section_shape(header, section)
+            if shape != expected:
+                raise ValueError(
+                    'Expected shape {} for "{}", got {}'.format(
+                        expected, section, shape
+                    )
+                )
+        buff = _encode_frame(header, data, self.codec)
+        if len(buff) != self.codec.frame_size:
+            raise ValueError(
+                'Expected {} bytes for the frame, got {}'.format(
+                    self.codec.frame_size, len(buff)
+                )
+            )
+        return buff
+
+    def write_frame(self, frame, data):
+        """Write a frame at its offset.
+
+        Parameters
+        ----------
+        frame : integer
+            The index of the frame.
+        data : dict
+            The data for the frame, as for :py:func:`.write_trr_frame`.
+        """
+        offset = self.frame_offset(frame)
+        buff = self.encode(data)
+        with self._lock:
+            fileno = self._get_fileno()
+        view = memoryview(buff)
+        if hasattr(os, 'pwrite'):
+            # pwrite may write fewer bytes than asked for:
+            while view:
+                written = os.pwrite(fileno, view, offset)
+                view = view[written:]
+                offset += written
+        else:  # pragma: no cover
+            with self._lock:
+                os.lseek(fileno, offset, os.SEEK_SET)
+                while view:
+                    view = view[os.write(fileno, view):]
+
+    def close(self):
+        """Close the file descriptor for this process."""
+        if self._fileno is not None and self._pid == os.getpid():
+            os.close(self._fileno)
+        self._fileno = None
+        self._pid = None
+
+    def __enter__(self):
+        """Return the writer for use in a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the file descriptor."""
+        self.close()
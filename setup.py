@@ -88,4 +88,7 @@ setup(
     keywords='gromacs simulation trr',
     packages=find_packages(),
     install_requires=get_requirements(),
+    entry_points={
+        'console_scripts': ['pytrr-compare = pytrr.compare:main'],
+    },
 )
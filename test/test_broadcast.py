@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for sharing frames between processes."""
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
+import unittest
+from pytrr.broadcast import FrameBroadcaster, FrameSubscriber, _lock_path
+import numpy as np
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+def make_frame(step, natoms=4):
+    """Create a header and data for a frame."""
+    header = {'natoms': natoms, 'step': step, 'time': 0.5 * step,
+              'lambda': 0.0}
+    data = {
+        'box': np.eye(3) * step,
+        'x': np.full((natoms, 3), float(step)),
+    }
+    return header, data
+
+
+def consume(name, queue):
+    """Read all frames in a consumer process."""
+    with FrameSubscriber(name, timeout=10) as ring:
+        queue.put('attached')
+        result = [(header['step'], data['x'].sum())
+                  for header, data in ring]
+    queue.put(result)
+
+
+def attach(name, barrier, queue):
+    """Attach to a ring at the same time as other processes."""
+    barrier.wait(timeout=10)
+    ring = FrameSubscriber(name, timeout=0.5)
+    queue.put(ring._entry)
+    # Keep the entry until the test is done:
+    barrier.wait(timeout=10)
+    ring.close()
+
+
+class TestBroadcast(unittest.TestCase):
+    """Test the shared memory frame ring."""
+
+    def test_ring(self):
+        """Test publishing and reading frames in one process."""
+        with FrameBroadcaster(4, nslots=3) as producer:
+            consumer = FrameSubscriber(producer.name)
+            self.assertEqual(producer.active_consumers(), 1)
+            for step in range(3):
+                producer.publish(*make_frame(step))
+            with self.assertRaises(TimeoutError):
+                producer.publish(*make_frame(3), timeout=0.01)
+            header, data = consumer.next_frame()
+            self.assertEqual(header['step'], 0)
+            self.assertEqual(sorted(data), ['box', 'x'])
+            with self.assertRaises(ValueError):
+                data['x'][0, 0] = 1.0
+            header, data = consumer.next_frame()
+            # Reading the second frame released the first:
+            producer.publish(*make_frame(3), timeout=0.01)
+            self.assertTrue(np.allclose(data['x'], 1.0))
+            producer.end()
+            steps = [header['step'] for header, _ in consumer]
+            self.assertEqual(steps, [2, 3])
+            with self.assertRaises(ValueError):
+                producer.publish(*make_frame(4))
+            late = FrameSubscriber(producer.name)
+            with self.assertRaises(EOFError):
+                late.next_frame()
+            late.close()
+            consumer.close()
+            self.assertEqual(producer.active_consumers(), 0)
+
+    def test_sections(self):
+        """Test that we only share the requested sections."""
+        with FrameBroadcaster(4, sections=('x', 'v')) as producer:
+            with FrameSubscriber(producer.name) as consumer:
+                self.assertEqual(consumer.sections, ('x', 'v'))
+                self.assertEqual(consumer.natoms, 4)
+                producer.publish(*make_frame(1))
+                _, data = consumer.next_frame(timeout=1)
+                self.assertEqual(list(data), ['x'])
+            with self.assertRaises(ValueError):
+                producer.publish(*make_frame(2, natoms=5))
+        with self.assertRaises(ValueError):
+            FrameBroadcaster(4, sections=('y',))
+
+    def test_attach_race(self):
+        """Test that consumers attaching at once get separate entries."""
+        with FrameBroadcaster(4, max_consumers=8) as producer:
+            self.assertTrue(os.path.isfile(_lock_path(producer.name)))
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                rings = list(pool.map(
+                    lambda _: FrameSubscriber(producer.name, timeout=0.5),
+                    range(8),
+                ))
+            self.assertEqual(sorted(i._entry for i in rings), list(range(8)))
+            with self.assertRaises(TimeoutError):
+                FrameSubscriber(producer.name, timeout=0.01)
+            for ring in rings:
+                ring.close()
+        with FrameBroadcaster(4, max_consumers=4) as producer:
+            lock_path = _lock_path(producer.name)
+            barrier = multiprocessing.Barrier(5)
+            queue = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(target=attach,
+                                        args=(producer.name, barrier, queue))
+                for _ in range(4)
+            ]
+            for worker in workers:
+                worker.start()
+            barrier.wait(timeout=10)
+            entries = [queue.get(timeout=10) for _ in workers]
+            self.assertEqual(producer.active_consumers(), 4)
+            barrier.wait(timeout=10)
+            for worker in workers:
+                worker.join(timeout=10)
+            self.assertEqual(sorted(entries), list(range(4)))
+        self.assertFalse(os.path.exists(lock_path))
+
+    def test_processes(self):
+        """Test broadcasting a file to several processes."""
+        xyz = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        queue = multiprocessing.Queue()
+        with FrameBroadcaster(xyz.shape[1], nslots=2) as producer:
+            workers = [
+                multiprocessing.Process(target=consume,
+                                        args=(producer.name, queue))
+                for _ in range(3)
+            ]
+            for worker in workers:
+                worker.start()
+            for _ in workers:
+                self.assertEqual(queue.get(timeout=10), 'attached')
+            producer.wait_for_consumers(3, timeout=10)
+            count = producer.broadcast(os.path.join(HERE, 'traj1.trr'),
+                                       timeout=10)
+            self.assertEqual(count, len(xyz))
+            producer.end()
+            results = [queue.get(timeout=10) for _ in workers]
+            for worker in workers:
+                worker.join(timeout=10)
+        expected = [(10 * i, xyz[i].sum()) for i in range(len(xyz))]
+        for result in results:
+            self.assertEqual([i[0] for i in result], [i[0] for i in expected])
+            self.assertTrue(np.allclose([i[1] for i in result],
+                                        [i[1] for i in expected]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for comparing TRR files."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from pytrr.compare import (
+    compare_trr,
+    diff_trr,
+    frame_checksums,
+    main,
+)
+from pytrr.index import TrrIndex
+from pytrr.pytrr import write_trr_frame
+from test_pytrr import generate_trr_data
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestCompare(unittest.TestCase):
+    """Test that we can checksum and compare TRR files."""
+
+    def test_checksums(self):
+        """Test that checksums are calculated for all sections."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        index = TrrIndex.from_file(filename)
+        checksums = frame_checksums(filename, index=index, workers=2,
+                                    store=True)
+        self.assertEqual(len(checksums), len(index))
+        self.assertIs(index.checksums, checksums)
+        for digest in checksums:
+            self.assertEqual(set(digest), {'header', 'box', 'x', 'v'})
+        sha = frame_checksums(filename, algorithm='sha256')
+        self.assertEqual(len(sha[0]['x']), 32)
+        self.assertNotEqual(sha[0]['x'], sha[1]['x'])
+
+    def test_diff(self):
+        """Test that we find the first differing frame and section."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file1 = os.path.join(tmpdir, 'traj1.trr')
+            file2 = os.path.join(tmpdir, 'traj2.trr')
+            all_data = generate_trr_data(file1, 5, 4)
+            shutil.copyfile(file1, file2)
+            self.assertEqual(diff_trr(file1, file2), [])
+            self.assertEqual(compare_trr(file1, file2), [])
+            # Write the frames again, with a small change in one frame
+            # and a large change in another.
+            os.remove(file2)
+            for i, (_, data) in enumerate(all_data):
+                data = dict(data)
+                if i == 2:
+                    data['v'] = data['v'] + 1e-6
+                if i == 3:
+                    data['x'] = data['x'] + 1.0
+                write_trr_frame(file2, data, append=True)
+            self.assertEqual(diff_trr(file1, file2, workers=1),
+                             [(2, 'v'), (3, 'x')])
+            self.assertEqual(compare_trr(file1, file2, atol=1e-5),
+                             [(3, 'x')])
+            write_trr_frame(file2, all_data[0][1], append=True)
+            self.assertEqual(diff_trr(file1, file2)[-1], (5, 'frame'))
+            with patch('sys.stdout'):
+                self.assertEqual(main([file1, file1]), 0)
+                self.assertEqual(main([file1, file2, '--atol', '1e-5']), 1)
+
+    def test_compare_damaged_copy(self):
+        """Test comparing with empty and truncated copies."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file1 = os.path.join(tmpdir, 'traj1.trr')
+            file2 = os.path.join(tmpdir, 'traj2.trr')
+            generate_trr_data(file1, 4, 4)
+            open(file2, 'wb').close()
+            expected = [(i, 'frame') for i in range(4)]
+            self.assertEqual(compare_trr(file1, file2), expected)
+            self.assertEqual(compare_trr(file2, file1), expected)
+            self.assertEqual(compare_trr(file2, file2), [])
+            shutil.copyfile(file1, file2)
+            os.truncate(file2, os.path.getsize(file1) - 10)
+            self.assertEqual(diff_trr(file1, file2), [(3, 'v')])
+            self.assertEqual(compare_trr(file1, file2), [(3, 'frame')])
+
+    def test_compare_precision(self):
+        """Test a numerical compare of single and double precision."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file1 = os.path.join(tmpdir, 'traj1.trr')
+            file2 = os.path.join(tmpdir, 'traj2.trr')
+            all_data = generate_trr_data(file1, 3, 4)
+            for _, data in all_data:
+                write_trr_frame(file2, data, double=True, append=True)
+            self.assertTrue(len(diff_trr(file1, file2)) > 0)
+            self.assertEqual(compare_trr(file1, file2, rtol=1e-6), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for the access pattern hints."""
+import mmap
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from pytrr import iohints
+from pytrr.iohints import (
+    advise_file,
+    advise_memmap,
+    drop_cache,
+    release_memmap,
+    CacheReleaser,
+)
+from pytrr.compare import frame_checksums
+from pytrr.index import TrrIndex
+from pytrr.positional import PositionalTrrReader
+from pytrr.pytrr import GroTrrReader
+from pytrr.timeseries import extract_timeseries
+import numpy as np
+from test_pytrr import generate_trr_data
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+FILENAME = os.path.join(HERE, 'traj1.trr')
+
+
+class TestIOHints(unittest.TestCase):
+    """Test that we can give hints about file access."""
+
+    def test_advise(self):
+        """Test giving hints for files and memory maps."""
+        fadvise = hasattr(os, 'posix_fadvise')
+        with open(FILENAME, 'rb') as fileh:
+            for access in iohints.ACCESS_PATTERNS:
+                self.assertEqual(advise_file(fileh, access), fadvise)
+            with self.assertRaises(ValueError):
+                advise_file(fileh, 'backwards')
+        raw = np.memmap(FILENAME, dtype=np.uint8, mode='r')
+        madvise = (hasattr(mmap.mmap, 'madvise') and
+                   hasattr(mmap, 'MADV_RANDOM'))
+        self.assertEqual(advise_memmap(raw, 'random'), madvise)
+        self.assertFalse(advise_memmap(np.zeros(3), 'random'))
+        self.assertEqual(drop_cache(FILENAME), fadvise)
+
+    def test_release_memmap(self):
+        """Test dropping a region of a memory map from the cache."""
+        fadvise = hasattr(os, 'posix_fadvise')
+        page = mmap.PAGESIZE
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'data')
+            with open(filename, 'wb') as fileh:
+                fileh.write(b'\1' * 4 * page)
+            raw = np.memmap(filename, dtype=np.uint8, mode='r')
+            self.assertEqual(raw[:4 * page].sum(), 4 * page)
+            with patch.object(iohints, 'drop_cache') as drop:
+                # Only whole pages inside the region are released:
+                release_memmap(raw, filename, 10, 2 * page)
+                drop.assert_called_once_with(filename, page, page)
+                self.assertFalse(release_memmap(raw, filename, 10, page))
+                self.assertEqual(drop.call_count, 1)
+            self.assertEqual(release_memmap(raw, filename, 0, 4 * page),
+                             fadvise)
+            # The map is still valid after releasing:
+            self.assertEqual(raw[:4 * page].sum(), 4 * page)
+            del raw
+
+    def test_release_blocks(self):
+        """Test that "once" releases each block after it is used."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            generate_trr_data(filename, 40, 100)
+            size = os.path.getsize(filename)
+            index = TrrIndex.from_file(filename)
+            runs = (
+                ('pytrr.timeseries', lambda: extract_timeseries(
+                    filename, fields=('x', 'v'), block_bytes=8 * 2400,
+                    access='once')),
+                ('pytrr.compare', lambda: frame_checksums(
+                    filename, access='once')),
+            )
+            for module, run in runs:
+                with patch(module + '.release_memmap') as release:
+                    with patch('pytrr.compare.HASH_BLOCK', 8):
+                        run()
+                regions = sorted((i[0][2], i[0][2] + i[0][3])
+                                 for i in release.call_args_list)
+                self.assertGreater(len(regions), 1)
+                self.assertEqual(regions[0][0], 0)
+                self.assertEqual(regions[-1][1], size)
+                for (_, stop), (start, _) in zip(regions, regions[1:]):
+                    self.assertEqual(stop, start)
+            with PositionalTrrReader(filename, index=index) as trr:
+                with patch('pytrr.positional.will_need') as need:
+                    trr.read_frames([3, 1])
+                need.assert_any_call(trr.fileno,
+                                     int(index.data_offsets[3]),
+                                     index.frame_end(3) -
+                                     int(index.data_offsets[3]))
+                self.assertEqual(need.call_count, 2)
+
+    def test_releaser(self):
+        """Test that consumed data is released in chunks."""
+        with open(FILENAME, 'rb') as fileh:
+            releaser = CacheReleaser(fileh)
+            with patch.object(iohints, 'release') as release:
+                releaser.consumed(100)
+                release.assert_not_called()
+                releaser.consumed(200, force=True)
+                release.assert_called_once_with(fileh, 0, 200)
+                self.assertEqual(releaser.released, 200)
+                releaser.consumed(200 + iohints.RELEASE_BYTES)
+                self.assertEqual(release.call_count, 2)
+
+    def test_reader_access(self):
+        """Test reading with the different access patterns."""
+        steps = []
+        for access in iohints.ACCESS_PATTERNS:
+            with GroTrrReader(FILENAME, access=access,
+                              buffering=256) as trrfile:
+                steps.append([header['step'] for header in trrfile])
+            with GroTrrReader(FILENAME, access=access) as trrfile:
+                frames = list(trrfile.frames())
+                self.assertEqual(frames[-1]['step'], steps[-1][-1])
+        for step in steps:
+            self.assertEqual(step, steps[0])
+        with self.assertRaises(ValueError):
+            GroTrrReader(FILENAME, access='backwards')
+        series1 = extract_timeseries(FILENAME, access='once')
+        series2 = extract_timeseries(FILENAME)
+        self.assertTrue(np.allclose(series1['x'], series2['x']))
+
+
+if __name__ == '__main__':
+    unittest.main()
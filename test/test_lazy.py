@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for the lazy array views."""
+import os
+import pickle
+import unittest
+from unittest.mock import patch
+from pytrr.lazy import TrrSectionArray, chunk_frames, to_dask, to_xarray
+import numpy as np
+try:
+    import dask
+except ImportError:
+    dask = None
+try:
+    import xarray
+except ImportError:
+    xarray = None
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+FILENAME = os.path.join(HERE, 'traj1.trr')
+
+
+class TestLazy(unittest.TestCase):
+    """Test the lazy array views."""
+
+    def setUp(self):
+        """Load the reference data."""
+        self.xyz1 = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        self.box1 = np.load(os.path.join(HERE, 'box1.npy'),
+                            allow_pickle=False)
+
+    def test_section_array(self):
+        """Test indexing of the lazy array."""
+        array = TrrSectionArray(FILENAME, 'x')
+        self.assertEqual(array.shape, self.xyz1.shape)
+        self.assertEqual(len(array), len(self.xyz1))
+        self.assertTrue(np.allclose(array[3], self.xyz1[3]))
+        self.assertTrue(np.allclose(array[-2:, 1], self.xyz1[-2:, 1]))
+        self.assertTrue(np.allclose(array[[0, 5], ..., 2],
+                                    self.xyz1[[0, 5], ..., 2]))
+        self.assertTrue(np.allclose(array[...], self.xyz1))
+        self.assertTrue(np.allclose(np.asarray(array), self.xyz1))
+        mask = np.arange(len(array)) % 3 == 0
+        self.assertTrue(np.allclose(array[mask], self.xyz1[mask]))
+        with self.assertRaises(IndexError):
+            array[len(array)]
+        # Slices and integers should not build an array over all frames:
+        with patch('numpy.arange', side_effect=AssertionError):
+            parts = (array[1:8:3], array[np.int64(-1)], array[2, 0])
+        self.assertTrue(np.allclose(parts[0], self.xyz1[1:8:3]))
+        self.assertTrue(np.allclose(parts[1], self.xyz1[-1]))
+        self.assertTrue(np.allclose(parts[2], self.xyz1[2, 0]))
+        array2 = pickle.loads(pickle.dumps(array))
+        self.assertTrue(np.allclose(array2[1], self.xyz1[1]))
+        self.assertEqual(chunk_frames(array, 16 * 3 * 8 * 4), 4)
+        self.assertEqual(chunk_frames(array, 1), 1)
+        with self.assertRaises(ValueError):
+            TrrSectionArray(FILENAME, 'f')
+
+    @unittest.skipIf(dask is None, 'dask is not installed')
+    def test_dask(self):
+        """Test the chunked dask array."""
+        array = to_dask(FILENAME, 'x', chunk_bytes=16 * 3 * 8 * 4)
+        self.assertEqual(array.chunks[0], (4, 4, 3))
+        mean = array.mean(axis=1).compute()
+        self.assertTrue(np.allclose(mean, self.xyz1.mean(axis=1)))
+
+    @unittest.skipIf(xarray is None, 'xarray is not installed')
+    def test_xarray(self):
+        """Test the xarray Dataset."""
+        dataset = to_xarray(FILENAME, sections=('x', 'box'))
+        self.assertEqual(dataset['x'].dims, ('time', 'atom', 'dim'))
+        self.assertEqual(list(dataset['step'].values), list(range(0, 101, 10)))
+        self.assertTrue(np.allclose(dataset['box'].values, self.box1))
+        self.assertTrue(np.allclose(dataset['x'].isel(time=2, atom=3).values,
+                                    self.xyz1[2, 3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
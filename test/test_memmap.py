@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for memory mapped editing of TRR files."""
+import os
+import shutil
+import tempfile
+import unittest
+from pytrr.compare import diff_trr, frame_checksums
+from pytrr.index import TrrIndex
+from pytrr.memmap import TrrMemmap
+from pytrr.pytrr import GroTrrReader, write_trr_frame
+import numpy as np
+from test_pytrr import generate_trr_data
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestMemmap(unittest.TestCase):
+    """Test memory mapped access to TRR files."""
+
+    def test_read(self):
+        """Test reading the sections and header fields."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        xyz1 = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        with TrrMemmap(filename, mode='r') as trr:
+            self.assertEqual(len(trr), len(xyz1))
+            frame = trr.frame(-1)
+            self.assertEqual(frame['step'], 100)
+            self.assertEqual(frame['natoms'], 16)
+            self.assertAlmostEqual(frame['time'], 0.2)
+            self.assertEqual(frame.x.dtype, np.dtype('>f4'))
+            self.assertTrue(np.allclose(frame.x, xyz1[-1]))
+            self.assertIsNone(frame.f)
+            self.assertTrue(trr.is_uniform())
+            self.assertTrue(np.allclose(trr.stacked('x'), xyz1))
+            self.assertTrue(np.array_equal(trr.column('step'),
+                                           np.arange(0, 101, 10)))
+            with self.assertRaises(IndexError):
+                trr.frame(len(xyz1))
+            with self.assertRaises(KeyError):
+                frame['missing']
+            with self.assertRaises(KeyError):
+                trr.stacked('f')
+
+    def test_edit(self):
+        """Test editing sections and headers in place."""
+        for double in (False, True):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                filename = os.path.join(tmpdir, 'traj.trr')
+                generate_trr_data(filename, 6, 4, double=double)
+                size = os.path.getsize(filename)
+                with TrrMemmap(filename) as trr:
+                    frame = trr.frame(2)
+                    frame.v[:] = 0.0
+                    frame.x[1] += 10.0
+                    frame['time'] = 123.5
+                    frame['step'] = 99
+                    self.assertEqual(trr.index.headers[2]['step'], 99)
+                    with self.assertRaises(KeyError):
+                        frame['natoms'] = 3
+                    with self.assertRaises(ValueError):
+                        trr.header_field(2, 'natoms')[()] = 3
+                    trr.column('lambda')[:] = 0.5
+                self.assertEqual(os.path.getsize(filename), size)
+                with GroTrrReader(filename) as trrfile:
+                    for i, header in enumerate(trrfile):
+                        data = trrfile.get_data()
+                        self.assertEqual(header['lambda'], 0.5)
+                        if i == 2:
+                            self.assertEqual(header['step'], 99)
+                            self.assertEqual(header['time'], 123.5)
+                            self.assertTrue(np.all(data['v'] == 0.0))
+                            self.assertTrue(np.all(data['x'][1] > 10.0))
+                        else:
+                            self.assertEqual(header['step'], i)
+
+    def test_edit_checksums(self):
+        """Test that edits through the views invalidate checksums."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file1 = os.path.join(tmpdir, 'traj1.trr')
+            file2 = os.path.join(tmpdir, 'traj2.trr')
+            generate_trr_data(file1, 6, 4)
+            shutil.copyfile(file1, file2)
+            index = TrrIndex.from_file(file2)
+            frame_checksums(file2, index=index, store=True)
+            TrrMemmap(file2, mode='r', index=index).close()
+            self.assertIsNotNone(index.checksums)
+            trr = TrrMemmap(file2, index=index)
+            trr.frame(3).v[:] = 0.0
+            self.assertEqual(diff_trr(file1, file2, index2=index),
+                             [(3, 'v')])
+            # Checksums calculated while the file is mapped:
+            trr.frame(4).x[:] = 0.0
+            trr.flush()
+            self.assertEqual(diff_trr(file1, file2, index2=index),
+                             [(3, 'v'), (4, 'x')])
+            trr.close()
+
+    def test_copy_on_write(self):
+        """Test that changes are not written in copy-on-write mode."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            shutil.copyfile(os.path.join(HERE, 'traj1.trr'), filename)
+            with TrrMemmap(filename, mode='c') as trr:
+                trr.frame(0).x[:] = 0.0
+                self.assertTrue(np.all(trr.frame(0).x == 0.0))
+            with TrrMemmap(filename, mode='r') as trr:
+                self.assertFalse(np.all(trr.frame(0).x == 0.0))
+                with self.assertRaises(ValueError):
+                    trr.frame(0).x[:] = 0.0
+
+    def test_not_uniform(self):
+        """Test that we do not stack frames with different layouts."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            data = generate_trr_data(filename, 2, 4)[0][1]
+            del data['v']
+            write_trr_frame(filename, data, append=True)
+            with TrrMemmap(filename, mode='r') as trr:
+                self.assertFalse(trr.is_uniform())
+                with self.assertRaises(ValueError):
+                    trr.stacked('x')
+                self.assertIsNone(trr.frame(2).v)
+
+
+if __name__ == '__main__':
+    unittest.main()
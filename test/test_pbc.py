@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for handling periodic boundaries."""
+import os
+import tempfile
+import unittest
+from pytrr.pbc import (
+    Unwrapper,
+    apply_image_offset,
+    center_positions,
+    chunk_offsets,
+    to_fractional,
+    wrap_positions,
+)
+from pytrr.pytrr import write_trr_frame
+from pytrr.timeseries import extract_timeseries
+import numpy as np
+
+
+BOX = np.array([[2.0, 0.0, 0.0], [0.5, 2.0, 0.0], [0.3, -0.4, 2.5]])
+
+
+def random_walk(nframes, natoms, seed=0):
+    """Generate an unwrapped random walk and the wrapped positions."""
+    rgen = np.random.RandomState(seed)
+    steps = rgen.uniform(-0.2, 0.2, size=(nframes, natoms, 3))
+    steps[0] = rgen.uniform(0.0, 2.0, size=(natoms, 3))
+    unwrapped = np.cumsum(steps, axis=0)
+    return unwrapped, wrap_positions(unwrapped, BOX)
+
+
+class TestPbc(unittest.TestCase):
+    """Test unwrapping and wrapping of positions."""
+
+    def test_wrap(self):
+        """Test that wrapped positions are inside the box."""
+        unwrapped, wrapped = random_walk(20, 5)
+        frac = to_fractional(wrapped, np.broadcast_to(BOX, (20, 3, 3)))
+        self.assertTrue(np.all(frac >= 0.0) and np.all(frac < 1.0))
+        self.assertTrue(np.allclose(wrap_positions(wrapped[3], BOX),
+                                    wrapped[3]))
+
+    def test_unwrap(self):
+        """Test that we can unwrap in batches and single frames."""
+        unwrapped, wrapped = random_walk(50, 6)
+        boxes = np.broadcast_to(BOX, (50, 3, 3))
+        unwrap = Unwrapper()
+        result = np.concatenate(
+            [unwrap(wrapped[i:i + 7], boxes[i:i + 7])
+             for i in range(0, 50, 7)]
+        )
+        shift = unwrapped[0] - result[0]
+        self.assertTrue(np.allclose(result + shift, unwrapped))
+        unwrap = Unwrapper()
+        single = np.array([unwrap(x, BOX) for x in wrapped])
+        self.assertTrue(np.allclose(single, result))
+
+    def test_chunks(self):
+        """Test stitching of chunks unwrapped independently."""
+        unwrapped, wrapped = random_walk(40, 4, seed=1)
+        boxes = np.broadcast_to(BOX, (40, 3, 3))
+        reference = Unwrapper()(wrapped, boxes)
+        chunks, unwrappers = [], []
+        for i in range(0, 40, 9):
+            unwrap = Unwrapper()
+            chunks.append(unwrap(wrapped[i:i + 9], boxes[i:i + 9]))
+            unwrappers.append(unwrap)
+        offsets = chunk_offsets(unwrappers)
+        stitched = np.concatenate(
+            [apply_image_offset(chunk, boxes[:len(chunk)], offset)
+             for chunk, offset in zip(chunks, offsets)]
+        )
+        self.assertTrue(np.allclose(stitched, reference))
+
+    def test_center(self):
+        """Test centering on a selection split by the boundary."""
+        box = np.diag([2.0, 2.0, 2.0])
+        x = np.array([[0.1, 1.0, 1.0], [1.9, 1.0, 1.0], [1.0, 0.5, 1.0]])
+        centered = center_positions(x, box, [0, 1])
+        self.assertTrue(np.allclose(centered[0], [1.1, 1.0, 1.0]))
+        self.assertTrue(np.allclose(centered[1], [0.9, 1.0, 1.0]))
+        self.assertTrue(np.allclose(centered[2], [0.0, 0.5, 1.0]))
+
+    def test_extract_unwrapped(self):
+        """Test unwrapping when extracting time series."""
+        unwrapped, wrapped = random_walk(30, 4, seed=2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            for i, x in enumerate(wrapped):
+                data = {'natoms': 4, 'step': i, 'time': 0.1 * i,
+                        'lambda': 0.0, 'box': BOX, 'x': x}
+                write_trr_frame(filename, data, double=True, append=True)
+            series = extract_timeseries(filename, atoms=[1, 3],
+                                        block_bytes=200,
+                                        transform=Unwrapper())
+            result = series['x'].transpose(1, 0, 2)
+            shift = unwrapped[0, [1, 3]] - result[0]
+            self.assertTrue(np.allclose(result + shift, unwrapped[:, [1, 3]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
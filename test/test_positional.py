@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for the thread-safe positional reader."""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import unittest
+from pytrr.positional import PositionalTrrReader
+from pytrr.pytrr import GroTrrReader
+import numpy as np
+from test_pytrr import generate_trr_data
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestPositionalReader(unittest.TestCase):
+    """Test reading frames with positional reads."""
+
+    def test_read(self):
+        """Test reading frames and sections."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        xyz1 = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        vel1 = np.load(os.path.join(HERE, 'v1.npy'), allow_pickle=False)
+        box1 = np.load(os.path.join(HERE, 'box1.npy'), allow_pickle=False)
+        with PositionalTrrReader(filename, access='random') as trr:
+            self.assertEqual(len(trr), len(xyz1))
+            for i in reversed(range(len(trr))):
+                header, data = trr.read_frame(i)
+                self.assertEqual(header['step'], 10 * i)
+                self.assertEqual(sorted(data), ['box', 'v', 'x'])
+                self.assertEqual(data['x'].dtype, np.float64)
+                self.assertTrue(np.allclose(data['x'], xyz1[i]))
+                self.assertTrue(np.allclose(data['v'], vel1[i]))
+                self.assertTrue(np.allclose(data['box'], box1[i]))
+            _, data = trr.read_frame(3, sections=('box', 'v'))
+            self.assertEqual(sorted(data), ['box', 'v'])
+            self.assertTrue(np.allclose(data['v'], vel1[3]))
+            self.assertTrue(np.allclose(trr.read_section(5, 'x'), xyz1[5]))
+            with self.assertRaises(KeyError):
+                trr.read_section(5, 'f')
+
+    def test_threads(self):
+        """Test reading from one reader in several threads."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            generate_trr_data(filename, 50, 20, double=True)
+            expected = []
+            with GroTrrReader(filename) as trrfile:
+                for _ in trrfile:
+                    expected.append(trrfile.get_data())
+            with PositionalTrrReader(filename) as trr:
+                frames = list(range(len(trr))) * 4
+                with ThreadPoolExecutor(max_workers=8) as pool:
+                    result = list(pool.map(trr.read_frame, frames))
+                for frame, (header, data) in zip(frames, result):
+                    self.assertEqual(header['step'], frame)
+                    for key, val in expected[frame].items():
+                        self.assertTrue(np.array_equal(data[key], val))
+                data = trr.read_frames([7, 2], sections=('x',), workers=2)
+                self.assertTrue(np.array_equal(data[0]['x'],
+                                               expected[7]['x']))
+                self.assertEqual(list(data[1]), ['x'])
+
+    def test_truncated(self):
+        """Test reading a frame from a truncated file."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            generate_trr_data(filename, 3, 4)
+            with PositionalTrrReader(filename) as trr:
+                size = os.path.getsize(filename)
+                os.truncate(filename, size - 8)
+                with self.assertRaises(EOFError):
+                    trr.read_frame(2)
+                trr.read_frame(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,19 +2,32 @@
 # Copyright (c) 2017, Anders Lervik.
 # Distributed under the LGPLv2.1+ License. See LICENSE for more info.
 """A test module for pytrr."""
+from collections.abc import Mapping
+import json
 import os
+import shutil
 import struct
+import sys
 import tempfile
 import unittest
 from pytrr.pytrr import (
     swap_integer,
     swap_endian,
+    get_codec,
+    get_struct,
     read_trr_header,
     write_trr_frame,
     GroTrrReader,
+    TrrFrame,
     TRR_VERSION_B,
     GROMACS_MAGIC,
+    HEAD_ITEMS,
+    HEADER_KEYS,
+    TrrHeader,
+    TrrHeaderArray,
 )
+from pytrr.index import TrrIndex
+import pickle
 import numpy as np
 
 
@@ -234,6 +247,119 @@ class TestGromacsTRR(unittest.TestCase):
                 with GroTrrReader(tmp.name) as gro:
                     gro.read_frame(read_data=False)
 
+    def test_codec(self):
+        """Test that codecs are cached and give the frame layout."""
+        codec = get_codec('>', False, 16, ('box', 'x', 'v'))
+        self.assertIs(codec, get_codec('>', False, 16, ('box', 'x', 'v')))
+        self.assertIs(get_struct('>13i'), get_struct('>13i'))
+        self.assertEqual(codec.dtype, np.dtype('>f4'))
+        self.assertEqual(codec.matrix_size, 36)
+        self.assertEqual(codec.coord_size, 192)
+        filename = os.path.join(HERE, 'traj1.trr')
+        with open(filename, 'rb') as inputfile:
+            read_trr_header(inputfile)
+            self.assertEqual(inputfile.tell(), codec.header_size)
+        self.assertEqual(os.path.getsize(filename) % codec.frame_size, 0)
+        codec = get_codec('<', True, 2, ('x',))
+        self.assertEqual(codec.frame_size, codec.header_size + 2 * 3 * 8)
+        header = {key: 0 for key in HEAD_ITEMS}
+        header.update({'natoms': 2, 'x_size': 48, 'step': 7})
+        with tempfile.NamedTemporaryFile() as tmp:
+            with open(tmp.name, 'wb') as outfile:
+                outfile.write(codec.pack_header(header))
+            with open(tmp.name, 'rb') as inputfile:
+                header2 = read_trr_header(inputfile)
+                self.assertEqual(header2['step'], 7)
+                self.assertEqual(header2['endian'], '<')
+                self.assertTrue(header2['double'])
+
+    def test_lazy_frames(self):
+        """Test that lazy frames read the data when accessed."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        box1 = np.load(os.path.join(HERE, 'box1.npy'), allow_pickle=False)
+        xyz1 = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        vel1 = np.load(os.path.join(HERE, 'v1.npy'), allow_pickle=False)
+        with GroTrrReader(filename) as trrfile:
+            frames = list(trrfile.frames())
+            self.assertEqual(len(frames), len(xyz1))
+            # Access the frames out of order:
+            for i in reversed(range(len(frames))):
+                frame = frames[i]
+                self.assertEqual(frame['step'], i * 10)
+                self.assertTrue(np.allclose(frame.x, xyz1[i]))
+                self.assertIs(frame.x, frame.x)
+                self.assertTrue(np.allclose(frame.box, box1[i]))
+                self.assertIsNone(frame.f)
+                data = frame.get_data()
+                self.assertEqual(set(data), {'box', 'x', 'v'})
+                self.assertTrue(np.allclose(data['v'], vel1[i]))
+        with GroTrrReader(filename) as trrfile:
+            # Mix lazy frames and the usual iteration:
+            header = next(trrfile)
+            self.assertEqual(header['step'], 0)
+            for i, frame in enumerate(trrfile.frames()):
+                if i % 2 == 0:
+                    self.assertTrue(np.allclose(frame.v, vel1[i + 1]))
+
+    def test_lazy_frame_error(self):
+        """Test that a failed read does not move the reader."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        index = TrrIndex.from_file(filename)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            truncated = os.path.join(tmpdir, 'truncated.trr')
+            shutil.copyfile(filename, truncated)
+            os.truncate(truncated, os.path.getsize(filename) - 10)
+            with GroTrrReader(truncated) as trrfile:
+                frames = trrfile.frames()
+                self.assertEqual(next(frames)['step'], 0)
+                last = TrrFrame(trrfile.fileh, index.headers[-1],
+                                int(index.data_offsets[-1]))
+                with self.assertRaises(struct.error):
+                    last.v
+                self.assertEqual(next(frames)['step'], 10)
+
+    def test_header_type(self):
+        """Test the compact header and the header array."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        with GroTrrReader(filename) as trrfile:
+            headers = [header for header in trrfile]
+        header = headers[1]
+        self.assertIsInstance(header, TrrHeader)
+        self.assertEqual(header['step'], 10)
+        self.assertEqual(header.step, 10)
+        self.assertEqual(header.get('lambda'), 0.0)
+        self.assertEqual(header.get('missing', 1), 1)
+        self.assertIn('endian', header)
+        self.assertNotIn('missing', header)
+        self.assertEqual(list(header), list(HEADER_KEYS))
+        self.assertEqual(header.asdict()['natoms'], 16)
+        self.assertEqual(dict(header), header.asdict())
+        self.assertEqual(pickle.loads(pickle.dumps(header)), header)
+        with self.assertRaises(KeyError):
+            header['missing']
+        with self.assertRaises(AttributeError):
+            header.missing
+        array = TrrHeaderArray(headers)
+        self.assertEqual(len(array), len(headers))
+        self.assertTrue(np.array_equal(array['step'],
+                                       [i['step'] for i in headers]))
+        self.assertEqual(array[1], header)
+        self.assertEqual(list(array[2:4]), headers[2:4])
+        self.assertEqual(TrrHeaderArray([header.asdict()])[0], header)
+        # The header behaves as a dictionary:
+        self.assertEqual(header, header.asdict())
+        self.assertEqual(tuple(header), HEADER_KEYS)
+        self.assertEqual(json.loads(json.dumps(dict(header))),
+                         json.loads(json.dumps(header.asdict())))
+        self.assertIsInstance(header, Mapping)
+        # Headers written with the native byte order:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = generate_trr_data(os.path.join(tmpdir, 'traj.trr'), 1, 2)
+        written = TrrHeaderArray([data[0][0]])
+        self.assertIn(written[0]['endian'], ('<', '>'))
+        self.assertEqual(written[0]['endian'],
+                         '<' if sys.byteorder == 'little' else '>')
+
 
 if __name__ == '__main__':
     unittest.main()
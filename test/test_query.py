@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for selecting frames from metadata."""
+import os
+import tempfile
+import unittest
+from pytrr.index import TrrIndex
+from pytrr.pytrr import write_trr_frame
+from pytrr.query import FrameTable
+import numpy as np
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestQuery(unittest.TestCase):
+    """Test the metadata table and selections."""
+
+    def test_boxes_in_index(self):
+        """Test that the index stores the boxes."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        box1 = np.load(os.path.join(HERE, 'box1.npy'), allow_pickle=False)
+        index = TrrIndex.from_file(filename, read_boxes=True)
+        self.assertTrue(np.allclose(index.boxes, box1))
+        self.assertIsNone(TrrIndex.from_file(filename).boxes)
+        table = FrameTable.from_file(filename)
+        self.assertTrue(np.allclose(table.columns['box'], box1))
+
+    def test_select(self):
+        """Test selecting frames and reading their data."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            all_x = []
+            for i in range(20):
+                data = {
+                    'natoms': 3,
+                    'step': i,
+                    'time': 1.0 * i,
+                    'lambda': 0.0,
+                    'box': np.diag([1.0 + 0.1 * i, 2.0, 2.0]),
+                    'x': np.full((3, 3), i, dtype=float),
+                }
+                if i % 2 == 0:
+                    data['v'] = np.ones((3, 3))
+                write_trr_frame(filename, data, append=True)
+                all_x.append(data['x'])
+            table = FrameTable.from_file(filename)
+            self.assertEqual(len(table), 20)
+            self.assertIn('volume', table)
+            self.assertTrue(np.allclose(table['volume'][2], 4.8))
+            frames = table.select(lambda t: t['volume'] > 8.0,
+                                  time=(10.0, 17.0), has_v=True)
+            self.assertEqual(list(frames), [12, 14, 16])
+            frames = table.select(step=(None, 2))
+            self.assertEqual(list(frames), [0, 1, 2])
+            mask = table['step'] % 5 == 0
+            self.assertEqual(list(table.select(mask)), [0, 5, 10, 15])
+            data = table.read(filename, [3, 12], sections=('x', 'v'))
+            self.assertTrue(np.allclose(data[0]['x'], all_x[3]))
+            self.assertNotIn('v', data[0])
+            self.assertTrue(np.allclose(data[1]['v'], 1.0))
+            with self.assertRaises(KeyError):
+                table.select(missing=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
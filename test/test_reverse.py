@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for reading TRR files from the end."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from pytrr.pytrr import GroTrrReader, write_trr_frame
+from pytrr.reverse import read_last_frame, reverse_frames
+from pytrr.storage import CallableStorage
+import numpy as np
+from test_pytrr import generate_trr_data
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+def read_all(filename):
+    """Read all frames in a file, from the start."""
+    frames = []
+    with GroTrrReader(filename) as trrfile:
+        for header in trrfile:
+            frames.append((header, trrfile.get_data()))
+    return frames
+
+
+def write_varying(filename, steps):
+    """Write frames with a varying number of atoms and sections."""
+    rgen = np.random.RandomState(steps)
+    for i in range(steps):
+        natoms = 3 + (7 * i) % 5
+        data = {'natoms': natoms, 'step': i, 'time': 0.1 * i,
+                'lambda': 0.0, 'box': rgen.random_sample(size=(3, 3)),
+                'x': rgen.random_sample(size=(natoms, 3))}
+        if i % 3 == 0:
+            data['v'] = rgen.random_sample(size=(natoms, 3))
+        write_trr_frame(filename, data, append=True)
+
+
+class TestReverse(unittest.TestCase):
+    """Test reading frames from the end of a file."""
+
+    def assert_frames(self, frames, expected):
+        """Check that frames are equal to the expected ones."""
+        self.assertEqual(len(frames), len(expected))
+        for (header, data), (header2, data2) in zip(frames, expected):
+            self.assertEqual(header, header2)
+            self.assertEqual(sorted(data), sorted(data2))
+            for key, val in data.items():
+                self.assertTrue(np.array_equal(val, data2[key]))
+
+    def test_uniform(self):
+        """Test a file where all frames have the same layout."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        xyz1 = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        header, data = read_last_frame(filename)
+        self.assertEqual(header['step'], 100)
+        self.assertTrue(np.allclose(data['x'], xyz1[-1]))
+        self.assert_frames(list(reverse_frames(filename)),
+                           read_all(filename)[::-1])
+        header, data = read_last_frame(filename, read_data=False)
+        self.assertEqual(header['step'], 100)
+        self.assertEqual(data, {})
+
+    def test_few_reads(self):
+        """Test that only the end of a uniform file is read."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            generate_trr_data(filename, 200, 50)
+            with open(filename, 'rb') as fileh:
+                raw = fileh.read()
+            requested = []
+
+            def reader(offset, size):
+                """Read from the file contents, keeping count."""
+                requested.append(size)
+                return raw[offset:offset + size]
+
+            storage = CallableStorage(reader, size=len(raw))
+            header, _ = read_last_frame(storage)
+            self.assertEqual(header['step'], 199)
+            self.assertLess(sum(requested), 3000)
+
+    def test_varying(self):
+        """Test a file where the frames have different layouts."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            write_varying(filename, 25)
+            expected = read_all(filename)
+            self.assert_frames(list(reverse_frames(filename)),
+                               expected[::-1])
+            self.assertEqual(read_last_frame(filename)[0]['step'], 24)
+            # Headers crossing the scanned blocks should also be found:
+            with patch('pytrr.reverse.SCAN_BLOCK', 37):
+                self.assert_frames(list(reverse_frames(filename)),
+                                   expected[::-1])
+
+    def test_mixed_precision(self):
+        """Test a file where the precision changes between frames."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            all_data = generate_trr_data(os.path.join(tmpdir, 'tmp.trr'),
+                                         9, 4)
+            for i, (_, data) in enumerate(all_data):
+                write_trr_frame(filename, data, double=i in (2, 3, 7),
+                                append=True)
+            expected = read_all(filename)
+            self.assert_frames(list(reverse_frames(filename)),
+                               expected[::-1])
+
+    def test_unknown_size(self):
+        """Test that a storage of unknown size gives a clear error."""
+        with open(os.path.join(HERE, 'traj1.trr'), 'rb') as fileh:
+            raw = fileh.read()
+        with self.assertRaises(ValueError):
+            read_last_frame(lambda offset, size: raw[offset:offset + size])
+        storage = CallableStorage(lambda offset, size:
+                                  raw[offset:offset + size], size=len(raw))
+        expected = read_all(os.path.join(HERE, 'traj1.trr'))
+        self.assertEqual(read_last_frame(storage)[0], expected[-1][0])
+
+    def test_truncated(self):
+        """Test that an incomplete last frame is skipped."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for case in ('uniform', 'varying'):
+                filename = os.path.join(tmpdir, '{}.trr'.format(case))
+                if case == 'uniform':
+                    generate_trr_data(filename, 10, 8, double=True)
+                else:
+                    write_varying(filename, 10)
+                expected = read_all(filename)
+                size = os.path.getsize(filename)
+                for cut in (1, 40, 100):
+                    partial = os.path.join(tmpdir, 'partial.trr')
+                    shutil.copyfile(filename, partial)
+                    os.truncate(partial, size - cut)
+                    self.assert_frames(list(reverse_frames(partial)),
+                                       expected[-2::-1])
+
+    def test_empty(self):
+        """Test files without complete frames."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            generate_trr_data(filename, 1, 4)
+            size = os.path.getsize(filename)
+            for cut in (size, size - 10, 10):
+                os.truncate(filename, size - cut)
+                self.assertEqual(list(reverse_frames(filename)), [])
+                with self.assertRaises(EOFError):
+                    read_last_frame(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
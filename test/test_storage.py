@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for the storage backends."""
+import os
+import tempfile
+import unittest
+from pytrr.index import TrrIndex, read_frames
+from pytrr.pytrr import GroTrrReader
+from pytrr.storage import (
+    CachedStorage,
+    CallableStorage,
+    FileStorage,
+    StorageFile,
+    coalesce_ranges,
+    open_storage,
+)
+import numpy as np
+from test_pytrr import generate_trr_data
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+class RemoteFile():
+    """A stand-in for a remote storage, counting the requests."""
+
+    def __init__(self, filename, strict=False):
+        with open(filename, 'rb') as fileh:
+            self.data = fileh.read()
+        self.requests = []
+        self.strict = strict
+
+    def __call__(self, offset, size):
+        self.requests.append((offset, size))
+        if self.strict and offset + size > len(self.data):
+            # Like object stores, reject ranges past the end:
+            raise OSError('Range {}-{} is not satisfiable'.format(
+                offset, offset + size
+            ))
+        return self.data[offset:offset + size]
+
+    def read_batch(self, ranges):
+        """Read several ranges in one (multi-range) request."""
+        self.requests.append(tuple(ranges))
+        return [self.data[offset:offset + size] for offset, size in ranges]
+
+    def transferred(self):
+        """Return the number of bytes transferred."""
+        total = 0
+        for request in self.requests:
+            if isinstance(request[0], tuple):
+                total += sum(i[1] for i in request)
+            else:
+                total += request[1]
+        return total
+
+
+class TestStorage(unittest.TestCase):
+    """Test reading via storage backends."""
+
+    def test_coalesce(self):
+        """Test that we merge ranges correctly."""
+        ranges = [(100, 10), (0, 10), (10, 5), (30, 5)]
+        self.assertEqual(coalesce_ranges(ranges),
+                         [(0, 15, [1, 2]), (30, 35, [3]), (100, 110, [0])])
+        self.assertEqual(coalesce_ranges(ranges, max_gap=15),
+                         [(0, 35, [1, 2, 3]), (100, 110, [0])])
+        storage = CallableStorage(RemoteFile(os.path.join(HERE, 'traj1.trr')),
+                                  max_gap=100)
+        data = storage.read_ranges(ranges)
+        self.assertEqual(storage.requests, 1)
+        self.assertEqual([len(i) for i in data], [10, 10, 5, 5])
+
+    def test_cache(self):
+        """Test the block cache."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        remote = RemoteFile(filename)
+        storage = CachedStorage(CallableStorage(remote, size=len(remote.data)),
+                                block_size=512, max_blocks=4)
+        self.assertEqual(storage.read_range(10, 20), remote.data[10:30])
+        self.assertEqual(storage.read_range(500, 100), remote.data[500:600])
+        self.assertEqual(storage.requests, 2)
+        self.assertEqual(storage.read_range(0, 1000), remote.data[:1000])
+        self.assertEqual(storage.requests, 2)
+        self.assertEqual(storage.read_range(5500, 100), remote.data[5500:])
+        self.assertEqual(storage.read_range(0, 5544), remote.data)
+        with StorageFile(storage) as fileh:
+            fileh.seek(-44, 2)
+            self.assertEqual(fileh.read(), remote.data[-44:])
+            self.assertEqual(fileh.tell(), len(remote.data))
+        with self.assertRaises(ValueError):
+            fileh.read(1)
+
+    def test_remote_index(self):
+        """Test indexing and reading with few requests."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            all_data = generate_trr_data(filename, 200, 3)
+            remote = RemoteFile(filename)
+            storage = open_storage(remote, size=len(remote.data),
+                                   block_size=4096)
+            index = TrrIndex.from_file(storage)
+            local = TrrIndex.from_file(filename)
+            self.assertTrue(np.array_equal(index.offsets, local.offsets))
+            self.assertEqual(len(index), 200)
+            self.assertTrue(len(remote.requests) < 10)
+            # Read with a cold cache and check that reads are coalesced:
+            remote.requests = []
+            storage = CallableStorage(remote, size=len(remote.data))
+            data = read_frames(storage, index, frames=range(10, 60),
+                               sections=('x', 'v'))
+            self.assertEqual(len(remote.requests), 1)
+            for i, frame in enumerate(data):
+                self.assertTrue(np.allclose(frame['x'],
+                                            all_data[10 + i][1]['x']))
+                self.assertNotIn('box', frame)
+            with GroTrrReader(remote) as trrfile:
+                for i, header in enumerate(trrfile):
+                    self.assertEqual(header['step'], i)
+            with open(filename, 'rb') as fileh:
+                storage = FileStorage(fileh)
+                self.assertEqual(storage.size(), len(remote.data))
+                data = read_frames(storage, index, frames=[199])
+                self.assertTrue(np.allclose(data[0]['box'],
+                                            all_data[199][1]['box']))
+            storage = FileStorage(filename)
+            self.assertEqual(storage.read_range(0, 4), remote.data[:4])
+            storage.close()
+
+    def test_remote_index_large_frames(self):
+        """Test indexing when the frames are larger than the blocks."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            generate_trr_data(filename, 150, 500)
+            remote = RemoteFile(filename)
+            storage = open_storage(remote, size=len(remote.data),
+                                   block_size=4096, max_blocks=4,
+                                   max_gap=1024,
+                                   batch_reader=remote.read_batch)
+            local = TrrIndex.from_file(filename)
+            frame_size = local.offsets[1] - local.offsets[0]
+            self.assertTrue(frame_size > 2 * 4096)
+            for read_boxes in (False, True):
+                remote.requests = []
+                index = TrrIndex.from_file(storage, read_boxes=read_boxes)
+                self.assertTrue(np.array_equal(index.offsets, local.offsets))
+                self.assertTrue(np.array_equal(index.data_offsets,
+                                               local.data_offsets))
+                # One block for the first frame, one batch for each
+                # prefetch and one read at the end of the file:
+                self.assertTrue(len(remote.requests) <= 5)
+                self.assertTrue(remote.transferred() < len(remote.data) / 20)
+            local = TrrIndex.from_file(filename, read_boxes=True)
+            self.assertTrue(np.allclose(index.boxes, local.boxes))
+            # Without a batch reader, we should not need more requests
+            # than with the block cache alone:
+            requests = []
+            for prefetch_bytes in (None, 0):
+                remote.requests = []
+                storage = open_storage(remote, size=len(remote.data),
+                                       block_size=4096, max_gap=1024)
+                if prefetch_bytes is not None:
+                    storage.prefetch_bytes = prefetch_bytes
+                index = TrrIndex.from_file(storage)
+                self.assertTrue(np.array_equal(index.offsets, local.offsets))
+                requests.append(len(remote.requests))
+            self.assertTrue(requests[0] <= requests[1])
+
+    def test_remote_index_strict(self):
+        """Test that indexing does not read past the end of the file."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'traj.trr')
+            generate_trr_data(filename, 10, 3)
+            local = TrrIndex.from_file(filename)
+            remote = RemoteFile(filename, strict=True)
+            for batch_reader in (None, remote.read_batch):
+                storage = open_storage(remote, size=len(remote.data),
+                                       block_size=512,
+                                       batch_reader=batch_reader)
+                index = TrrIndex.from_file(storage, read_boxes=True)
+                self.assertTrue(np.array_equal(index.offsets, local.offsets))
+            # Without a known size, nothing is prefetched:
+            storage = open_storage(remote, block_size=512)
+            storage.prefetch([(0, 10), (10000, 10)])
+            self.assertEqual(storage._range_bytes, 0)
+
+    def test_prefetch_keeps_blocks(self):
+        """Test that prefetching does not evict the cached blocks."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        remote = RemoteFile(filename)
+        backend = CallableStorage(remote, size=len(remote.data), max_gap=0,
+                                  batch_reader=remote.read_batch)
+        storage = CachedStorage(backend, block_size=512, max_blocks=2)
+        self.assertEqual(storage.read_range(0, 100), remote.data[:100])
+        ranges = [(1000 * i, 50) for i in range(1, 6)]
+        storage.prefetch(ranges)
+        self.assertEqual(len(remote.requests), 2)
+        self.assertEqual(remote.requests[1], tuple(ranges))
+        self.assertEqual(storage.read_ranges(ranges),
+                         [remote.data[i:i + j] for i, j in ranges])
+        self.assertEqual(storage.read_range(0, 100), remote.data[:100])
+        self.assertEqual(len(remote.requests), 2)
+        # The prefetched bytes stay below the capacity of the cache:
+        storage.prefetch([(0, 600), (1000, 600)])
+        self.assertTrue(storage._range_bytes <= storage.prefetch_bytes)
+        self.assertTrue(storage.prefetch_bytes < 2 * 512)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for extracting time series from TRR files."""
+import os
+import tempfile
+import unittest
+from pytrr.index import TrrIndex
+from pytrr.timeseries import extract_timeseries
+import numpy as np
+from test_pytrr import generate_trr_data
+
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestTrrIndex(unittest.TestCase):
+    """Test that we can index TRR files."""
+
+    def test_index(self):
+        """Test that the index locates the frames."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        index = TrrIndex.from_file(filename)
+        xyz1 = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        self.assertEqual(len(index), len(xyz1))
+        self.assertEqual(index.offsets[0], 0)
+        for i, header in enumerate(index.headers):
+            self.assertEqual(header['step'], i * 10)
+        self.assertEqual(index.section_offset(0, 'box'),
+                         index.data_offsets[0])
+        self.assertEqual(index.section_offset(0, 'x'),
+                         index.data_offsets[0] + 36)
+        with self.assertRaises(KeyError):
+            index.section_offset(0, 'f')
+        with self.assertRaises(KeyError):
+            index.section_offset(0, 'y')
+        raw = np.memmap(filename, dtype=np.uint8, mode='r')
+        view = index.section_view(raw, 4, 'x')
+        self.assertEqual(view.dtype, np.dtype('>f4'))
+        self.assertTrue(np.allclose(view, xyz1[4]))
+        with self.assertRaises(KeyError):
+            index.section_view(raw, 4, 'f')
+
+
+class TestTimeseries(unittest.TestCase):
+    """Test that we can extract per-atom time series."""
+
+    def test_extract(self):
+        """Test extraction for a file from GROMACS."""
+        filename = os.path.join(HERE, 'traj1.trr')
+        xyz1 = np.load(os.path.join(HERE, 'x1.npy'), allow_pickle=False)
+        vel1 = np.load(os.path.join(HERE, 'v1.npy'), allow_pickle=False)
+        atoms = [0, 3, 15]
+        series = extract_timeseries(filename, atoms=atoms, fields=('x', 'v'),
+                                    block_bytes=100)
+        self.assertEqual(series['x'].shape, (3, len(xyz1), 3))
+        self.assertTrue(np.allclose(series['x'],
+                                    xyz1[:, atoms].transpose(1, 0, 2)))
+        self.assertTrue(np.allclose(series['v'],
+                                    vel1[:, atoms].transpose(1, 0, 2)))
+        series = extract_timeseries(filename, frames=[-1, 0])
+        self.assertTrue(np.allclose(series['x'][:, 0], xyz1[-1]))
+        self.assertTrue(np.allclose(series['x'][:, 1], xyz1[0]))
+        with self.assertRaises(IndexError):
+            extract_timeseries(filename, frames=[len(xyz1)])
+        with self.assertRaises(KeyError):
+            extract_timeseries(filename, fields=('f',))
+
+    def test_extract_written(self):
+        """Test extraction in double precision and to memory maps."""
+        for double, endian in ((True, '<'), (False, '>')):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                filename = os.path.join(tmpdir, 'traj.trr')
+                all_data = generate_trr_data(filename, 7, 5, double=double,
+                                             endian=endian)
+                outfile = os.path.join(tmpdir, 'series-{}.npy')
+                series = extract_timeseries(filename, atoms=slice(1, 4),
+                                            frames=slice(0, None, 2),
+                                            block_bytes=1, outfile=outfile)
+                self.assertTrue(os.path.isfile(outfile.format('x')))
+                for j, i in enumerate(range(0, 7, 2)):
+                    self.assertTrue(np.allclose(series['x'][:, j],
+                                                all_data[i][1]['x'][1:4]))
+                del series
+                stored = np.load(outfile.format('x'))
+                self.assertEqual(stored.shape, (3, 4, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
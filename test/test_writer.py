@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017, Anders Lervik.
+# Distributed under the LGPLv2.1+ License. See LICENSE for more info.
+"""A test module for writing TRR files at precomputed offsets."""
+from concurrent.futures import ProcessPoolExecutor
+import filecmp
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pytrr.pytrr import write_trr_frame
+from pytrr.writer import PresizedTrrWriter
+import numpy as np
+
+
+def make_data(step, natoms=5):
+    """Create data for a frame."""
+    rgen = np.random.RandomState(step)
+    return {
+        'natoms': natoms,
+        'step': step,
+        'time': 0.002 * step,
+        'lambda': 0.0,
+        'box': rgen.random_sample(size=(3, 3)),
+        'x': rgen.random_sample(size=(natoms, 3)),
+        'v': rgen.random_sample(size=(natoms, 3)),
+    }
+
+
+def write_frame(writer, frame):
+    """Write a frame from a worker process."""
+    writer.write_frame(frame, make_data(frame))
+    writer.close()
+    return frame
+
+
+class TestPresizedWriter(unittest.TestCase):
+    """Test that we can write frames at precomputed offsets."""
+
+    def test_equivalent(self):
+        """Test that the output is identical to a serial write."""
+        cases = ({}, {'double': True, 'endian': '>'}, {'endian': '<'})
+        for case in cases:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                serial = os.path.join(tmpdir, 'serial.trr')
+                presized = os.path.join(tmpdir, 'presized.trr')
+                for i in range(8):
+                    write_trr_frame(serial, make_data(i), append=True,
+                                    **case)
+                with PresizedTrrWriter(presized, 8, 5, **case) as writer:
+                    writer.create()
+                    self.assertEqual(os.path.getsize(presized), writer.size)
+                    for i in reversed(range(8)):
+                        writer.write_frame(i, make_data(i))
+                self.assertTrue(filecmp.cmp(serial, presized, shallow=False))
+
+    def test_processes(self):
+        """Test writing frames from several processes."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            serial = os.path.join(tmpdir, 'serial.trr')
+            presized = os.path.join(tmpdir, 'presized.trr')
+            for i in range(12):
+                write_trr_frame(serial, make_data(i), append=True)
+            writer = PresizedTrrWriter(presized, 12, 5)
+            writer.create()
+            with ProcessPoolExecutor(max_workers=2) as pool:
+                done = list(pool.map(write_frame, [writer] * 12, range(12)))
+            self.assertEqual(done, list(range(12)))
+            self.assertTrue(filecmp.cmp(serial, presized, shallow=False))
+
+    def test_layout_errors(self):
+        """Test that we reject frames not matching the layout."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = PresizedTrrWriter(os.path.join(tmpdir, 'out.trr'), 2, 5,
+                                       coords=('x',))
+            with self.assertRaises(ValueError):
+                writer.encode(make_data(0))
+            with self.assertRaises(ValueError):
+                writer.encode(make_data(0, natoms=3))
+            with self.assertRaises(IndexError):
+                writer.frame_offset(2)
+            with self.assertRaises(ValueError):
+                PresizedTrrWriter('out.trr', 2, 5, coords=('y',))
+            # Sections with the wrong shape must not spill into (or
+            # leave holes before) the next frame:
+            writer = PresizedTrrWriter(os.path.join(tmpdir, 'out.trr'), 2, 5)
+            for key, shape in (('x', (6, 3)), ('v', (4, 3)), ('box', (3,))):
+                data = make_data(0)
+                data[key] = np.zeros(shape)
+                with self.assertRaises(ValueError):
+                    writer.encode(data)
+            self.assertEqual(len(writer.encode(make_data(0))),
+                             writer.codec.frame_size)
+
+    def test_short_writes(self):
+        """Test that short positional writes are completed."""
+        pwrite = os.pwrite
+
+        def short_pwrite(fileno, buff, offset):
+            """Write at most 7 bytes at a time."""
+            return pwrite(fileno, bytes(buff[:7]), offset)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            serial = os.path.join(tmpdir, 'serial.trr')
+            presized = os.path.join(tmpdir, 'presized.trr')
+            for i in range(3):
+                write_trr_frame(serial, make_data(i), append=True)
+            with PresizedTrrWriter(presized, 3, 5) as writer:
+                writer.create()
+                with mock.patch('os.pwrite', side_effect=short_pwrite):
+                    for i in range(3):
+                        writer.write_frame(i, make_data(i))
+            self.assertTrue(filecmp.cmp(serial, presized, shallow=False))
+
+
+if __name__ == '__main__':
+    unittest.main()